@@ -1,3 +1,4 @@
+import argparse
 import os
 import gradio as gr
 from app_modules.presets import *
@@ -7,25 +8,31 @@ from src.item_base import create_items
 from src.bidder_base import Bidder
 from src.human_bidder import HumanBidder
 from src.auctioneer_base import Auctioneer
-from auction_workflow import run_auction, make_auction_hash
+from src.llm_hedge import HedgeBudget, Hedger
+from auction_workflow import arun_auction, make_auction_hash
 from utils import chunks, reset_state_list
 
 
+parser = argparse.ArgumentParser()
+parser.add_argument('--hedge_percentile', type=float, help='Send a duplicate of an LLM call slower than this percentile of recent latencies of its model (e.g., 95), and take the first response.')
+parser.add_argument('--max_hedges', type=int, default=50, help='Maximum number of duplicate requests per auction.')
+parser.add_argument('--max_hedge_cost', type=float, help='Maximum estimated extra cost ($) of duplicate requests per auction.')
+app_args, _ = parser.parse_known_args()
+
 BIDDER_NUM = 4
 items = create_items('data/items_demo.jsonl')
 
-def auction_loop_app(*args):
+async def auction_loop_app(*args):
     global items
 
     bidder_list = args[0]   # gr.State() -> session state
     items_id = args[1]
     os.environ['OPENAI_API_KEY'] = args[2] if args[2] != '' else os.environ.get('OPENAI_API_KEY', '')
     os.environ['ANTHROPIC_API_KEY'] = args[3] if args[3] != '' else os.environ.get('ANTHROPIC_API_KEY', '')
-    thread_num = args[4]
-    item_shuffle = args[5]
-    enable_discount = args[6]
-    min_markup_pct = args[7]
-    args = args[8:]
+    item_shuffle = args[4]
+    enable_discount = args[5]
+    min_markup_pct = args[6]
+    args = args[7:]
     auction_hash = make_auction_hash()
 
     items_to_bid = [items[i] for i in items_id]
@@ -63,7 +70,14 @@ def auction_loop_app(*args):
         else:
             bidder_list.append(Bidder.create(**js))
     
-    yield from run_auction(auction_hash, auctioneer, bidder_list, thread_num, yield_for_demo=True)
+    if app_args.hedge_percentile:
+        hedge_budget = HedgeBudget(percentile=app_args.hedge_percentile, max_hedges=app_args.max_hedges, max_cost=app_args.max_hedge_cost)
+        for bidder in bidder_list:
+            bidder.hedger = Hedger(hedge_budget)
+    
+    # concurrency adapts to each provider's rate limits, so no thread number is needed
+    async for outputs in arun_auction(auction_hash, auctioneer, bidder_list, thread_num=None, yield_for_demo=True):
+        yield outputs
 
 
 with open("assets/custom.css", "r", encoding="utf-8") as f:
@@ -113,16 +127,6 @@ with gr.Blocks(css=customCSS, theme=small_and_beautiful_theme) as demo:
                         info="The minimum percentage to increase a bid.",
                     )
 
-                    thread_num = gr.Slider(
-                        minimum=1,
-                        maximum=BIDDER_NUM,
-                        value=min(5, BIDDER_NUM),
-                        step=1,
-                        interactive=True,
-                        label='Thread Number',
-                        info="More threads, faster bidding, but will run into RateLimitError quicker."
-                    )
-
     with gr.Row():
         bidder_info_gr = []
         chatbots = []
@@ -261,7 +265,19 @@ with gr.Blocks(css=customCSS, theme=small_and_beautiful_theme) as demo:
                                 )
                                 money_monitor = gr.Number(
                                     label='API Cost ($)', 
-                                    info='Only OpenAI cost for now.',
+                                    info='OpenAI cost, and Anthropic cost estimated from token counts.',
+                                    interactive=False
+                                )
+
+                            with gr.Row():
+                                hedge_monitor = gr.Number(
+                                    label='Hedged Calls',
+                                    info='Duplicate requests sent for slow LLM calls.',
+                                    interactive=False
+                                )
+                                hedge_win_monitor = gr.Number(
+                                    label='Hedge Win Rate',
+                                    info='Share of duplicates that returned first.',
                                     interactive=False
                                 )
                                 
@@ -324,6 +340,8 @@ with gr.Blocks(css=customCSS, theme=small_and_beautiful_theme) as demo:
                             budget_belief_monitor,
                             profit_belief_monitor,
                             win_bid_belief_monitor,
+                            hedge_monitor,
+                            hedge_win_monitor,
                         ]
 
                 bidder_info_gr += [
@@ -355,7 +373,7 @@ with gr.Blocks(css=customCSS, theme=small_and_beautiful_theme) as demo:
 
     start_args = dict(
         fn=auction_loop_app,
-        inputs=[bidder_list_state, items_checkbox, openai_key, anthropic_key, thread_num, item_shuffle, enable_discount, min_markup_pct] + bidder_info_gr,
+        inputs=[bidder_list_state, items_checkbox, openai_key, anthropic_key, item_shuffle, enable_discount, min_markup_pct] + bidder_info_gr,
         outputs=[bidder_list_state] + chatbots + monitors + [bidding_log] + btn_list + textbox_list, # TODO: handle textbox_list interactivity
         show_progress=True,
     )
@@ -1,13 +1,26 @@
+import asyncio
+import contextlib
 import os
+import random
+import threading
 import time
 import gradio as gr
 import ujson as json
-import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from typing import List
 from tqdm import tqdm
 from src.auctioneer_base import Auctioneer
-from src.bidder_base import Bidder, bidders_to_chatbots, bidding_multithread
-from utils import trace_back
+from src.best_of_n import BestOfN, parse_best_of_n
+from src.bidder_base import Bidder, bidders_to_chatbots, bidding_async, create_bidders
+from src.deadlines import Deadlines
+from src.item_base import create_items
+from src.llm_base import set_llm_cache, get_llm_cache, set_rate_limiter, set_retry_controller, get_retry_controller, set_single_flight, get_single_flight_stats
+from src.llm_cache import LLMCache
+from src.llm_clients import open_session
+from src.llm_hedge import HedgeBudget, Hedger
+from src.llm_retry import RetryController
+from src.rate_limiter import RateLimiter, parse_rate_limits
+from utils import LoadJsonL, trace_back
 
 
 LOG_DIR = 'logs'
@@ -20,15 +33,118 @@ def monitor_all(bidder_list: List[Bidder]):
 
 
 def parse_bid_price(auctioneer: Auctioneer, bidder: Bidder, msg: str):
-    # rebid if the message is not parsible into a bid price
-    bid_price = auctioneer.parse_bid(msg)
-    while bid_price is None:
-        re_msg = bidder.bid("You must be clear about your bidding decision, say either \"I'm out!\" or \"I bid $xxx!\". Please rebid.")
-        bid_price = auctioneer.parse_bid(re_msg)
-        print(f"{bidder.name} rebid: {re_msg}")
+    return asyncio.run(aparse_bid_price(auctioneer, bidder, msg))
+
+
+async def aparse_bid_price(auctioneer: Auctioneer, bidder: Bidder, msg: str):
+    # a decision caught while streaming the bid, or a structured one, needs no parsing
+    bid_price = bidder.get_parsed_bid_price(msg)
+    if bid_price is None:
+        bid_price = await auctioneer.aparse_bid(msg)
+    if bid_price is None:
+        bid_price = await arebid_until_clear(auctioneer, bidder)
     return bid_price
 
 
+async def abid_round(auctioneer: Auctioneer, bidder_list: List[Bidder], instruct_list: List[str], thread_num: int = None):
+    '''
+    The responses of bidders to their bid instructions of a round. Bidders who cannot afford
+    any valid bid withdraw without an LLM call.
+    '''
+    msgs = [None] * len(bidder_list)
+    asked = []
+    for i, (bidder, instruct) in enumerate(zip(bidder_list, instruct_list)):
+        if auctioneer.is_infeasible(bidder):
+            msgs[i] = bidder.withdraw_without_llm(instruct)
+        else:
+            asked.append(i)
+    results = await bidding_async([bidder_list[i] for i in asked], [instruct_list[i] for i in asked], func_type='bid', thread_num=thread_num)
+    for i, msg in zip(asked, results):
+        msgs[i] = msg
+    return msgs
+
+
+async def aparse_round_bid_prices(auctioneer: Auctioneer, bidder_list: List[Bidder], msgs: List[str]):
+    '''
+    Parse the bids of a round at once. Bids that cannot be parsed are None, and rule bidders are skipped.
+    '''
+    bid_prices = [None] * len(msgs)
+    unparsed = []
+    for i, (msg, bidder) in enumerate(zip(msgs, bidder_list)):
+        if bidder.model_name == 'rule':
+            continue
+        bid_prices[i] = bidder.get_parsed_bid_price(msg)
+        if bid_prices[i] is None:
+            unparsed.append(i)
+    parsed = await auctioneer.aparse_bids([msgs[i] for i in unparsed])
+    for i, bid_price in zip(unparsed, parsed):
+        bid_prices[i] = bid_price
+    return bid_prices
+
+
+async def arebid_until_clear(auctioneer: Auctioneer, bidder: Bidder):
+    '''
+    Ask `bidder` to rebid until its decision can be parsed, at most `auctioneer.max_rebids` times.
+    :return: the bid price, -1 (withdrawal) if it is still unclear
+    '''
+    for _ in range(auctioneer.max_rebids):
+        re_msg = await bidder.abid("You must be clear about your bidding decision, say either \"I'm out!\" or \"I bid $xxx!\". Please rebid.", phase='rebid')
+        bid_price = bidder.get_parsed_bid_price(re_msg)
+        if bid_price is None:
+            bid_price = await auctioneer.aparse_bid(re_msg)
+        print(f"{bidder.name} rebid: {re_msg}")
+        if bid_price is not None:
+            return bid_price
+    bidder.record_fallback('rebid', f'unclear after {auctioneer.max_rebids} rebids')
+    return -1
+
+
+async def aresolve_bid(auctioneer: Auctioneer, bidder: Bidder, msg: str, bid_price: int):
+    '''
+    Ask `bidder` to rebid until its bid of the round is clear and passes the sanity check.
+    A bid still invalid after `auctioneer.max_rebids` rebids becomes a withdrawal.
+    :param bid_price: the parsed price of `msg`, None if unclear
+    :return: (the last response, its bid price)
+    '''
+    if bidder.model_name == 'rule':
+        bid_price = bidder.bid_rule(auctioneer.prev_round_max_bid, auctioneer.min_markup_pct)
+    elif bid_price is None:
+        bid_price = await arebid_until_clear(auctioneer, bidder)
+    
+    # can't bid more than budget or less than previous highest bid
+    rebid_cnt = 0
+    while True:
+        fail_msg = bidder.bid_sanity_check(bid_price, auctioneer.prev_round_max_bid, auctioneer.min_markup_pct)
+        if fail_msg is None: 
+            break
+        if rebid_cnt == auctioneer.max_rebids:
+            bidder.record_fallback('rebid', f'invalid after {rebid_cnt} rebids: {fail_msg}')
+            bid_price = -1
+            break
+        rebid_cnt += 1
+        bidder.need_input = True
+        auctioneer_msg = auctioneer.ask_for_rebid(fail_msg=fail_msg, bid_price=bid_price)
+        rebid_instruct = bidder.get_rebid_instruct(auctioneer_msg)
+        msg = await bidder.arebid_for_failure(rebid_instruct)
+        bid_price = await aparse_bid_price(auctioneer, bidder, msg)
+    return msg, bid_price
+
+
+async def aresolve_round_bids(auctioneer: Auctioneer, bidder_list: List[Bidder], msgs: List[str], bid_prices: List[int], thread_num: int = None):
+    '''
+    `aresolve_bid` for all bidders of a round at once, since their checks only depend on the last round.
+    Results are in the order of `bidder_list`, to be recorded in that order.
+    '''
+    semaphore = asyncio.Semaphore(int(thread_num)) if thread_num else contextlib.nullcontext()
+
+    async def resolve_once(bidder: Bidder, msg: str, bid_price: int):
+        async with semaphore:
+            return await aresolve_bid(auctioneer, bidder, msg, bid_price)
+
+    return await asyncio.gather(*[resolve_once(bidder, msg, bid_price) 
+                                  for bidder, msg, bid_price in zip(bidder_list, msgs, bid_prices)])
+
+
 def enable_human_box(bidder_list):
     signals = []
     for bidder in bidder_list:
@@ -51,17 +167,64 @@ def disable_all_box(bidder_list):
     return signals
 
 
+_engine = threading.local()
+
+
+def _get_engine_loop():
+    # one event loop per thread for all auctions, so that pooled LLM connections are reused across auctions
+    if getattr(_engine, 'loop', None) is None or _engine.loop.is_closed():
+        _engine.loop = asyncio.new_event_loop()
+    return _engine.loop
+
+
 def run_auction(
     auction_hash: str, 
     auctioneer: Auctioneer, 
     bidder_list: List[Bidder], 
-    thread_num: int, 
+    thread_num: int = None, 
+    yield_for_demo=True,
+    log_dir=LOG_DIR,
+    repeat_num=0,
+    memo_file=None,
+    pipeline=True):
+    '''
+    Synchronous driver of `arun_auction`, for callers that iterate a plain generator.
+    '''
+    loop = _get_engine_loop()
+    agen = arun_auction(auction_hash, auctioneer, bidder_list, thread_num, 
+                        yield_for_demo=yield_for_demo, log_dir=log_dir, 
+                        repeat_num=repeat_num, memo_file=memo_file, pipeline=pipeline)
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(agen.__anext__())
+            except StopAsyncIteration:
+                break
+    finally:
+        loop.run_until_complete(agen.aclose())
+
+
+async def arun_auction(
+    auction_hash: str, 
+    auctioneer: Auctioneer, 
+    bidder_list: List[Bidder], 
+    thread_num: int = None, 
     yield_for_demo=True,
     log_dir=LOG_DIR,
     repeat_num=0,
-    memo_file=None):
+    memo_file=None,
+    pipeline=True):
+    '''
+    :param pipeline: between two items, let every bidder summarize, replan and make its first bid on
+        the next item on its own, instead of waiting for all bidders after each phase. Not in the demo,
+        which shows every phase and waits for human bidders.
+    '''
     
     # bidder_list[0].verbose=True
+    if auctioneer.deadlines is not None:
+        auctioneer.deadlines.start()    # setup before the auction does not count
+    open_session()
+    pipeline = pipeline and not yield_for_demo
     
     if yield_for_demo:
         chatbot_list = bidders_to_chatbots(bidder_list)
@@ -76,7 +239,7 @@ def run_auction(
                     data = json.load(f)
                     past_learnings = data['learnings'][bidder.name]
                     past_auction_log = data['auction_log']
-                    bidder.learn_from_prev_auction(past_learnings, past_auction_log)
+                    await bidder.alearn_from_prev_auction(past_learnings, past_auction_log)
     
     # ***************** Plan Round *****************
     # init bidder profit
@@ -86,68 +249,92 @@ def run_auction(
 
     plan_instructs = [bidder.get_plan_instruct(auctioneer.items) for bidder in bidder_list]
 
-    bidding_multithread(bidder_list, plan_instructs, func_type='plan', thread_num=thread_num)
+    await bidding_async(bidder_list, plan_instructs, func_type='plan', thread_num=thread_num)
     
     if yield_for_demo:
         chatbot_list = bidders_to_chatbots(bidder_list)
         yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + disable_all_box(bidder_list)
     
     bar = tqdm(total=len(auctioneer.items_queue), desc='Auction Progress')
-    while not auctioneer.end_auction():
-        cur_item = auctioneer.present_item()
+    first_msgs = None   # first bids on the presented item, made at the end of the pipelines of bidders
+    while first_msgs is not None or not auctioneer.end_auction():
+        if first_msgs is None:
+            cur_item = auctioneer.present_item()
         
         bid_round = 0
         while True:
             # ***************** Bid Round ***************** 
-            auctioneer_msg = auctioneer.ask_for_bid(bid_round)
-            _bidder_list = []
-            _bid_instruct_list = []
-            # remove highest bidder and withdrawn bidders
-            for bidder in bidder_list:
-                if bidder is auctioneer.highest_bidder or bidder.withdraw:
-                    bidder.need_input = False
-                    continue
-                else:
-                    bidder.need_input = True    # enable input from demo
-                    instruct = bidder.get_bid_instruct(auctioneer_msg, bid_round)
-                    _bidder_list.append(bidder)
-                    _bid_instruct_list.append(instruct)
-            
-            if yield_for_demo:
-                chatbot_list = bidders_to_chatbots(bidder_list)
-                yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + enable_human_box(bidder_list)
-            
-            _msgs = bidding_multithread(_bidder_list, _bid_instruct_list, func_type='bid', thread_num=thread_num)
-
-            for i, (msg, bidder) in enumerate(zip(_msgs, _bidder_list)):
-                if bidder.model_name == 'rule':
-                    bid_price = bidder.bid_rule(auctioneer.prev_round_max_bid, auctioneer.min_markup_pct)
-                else:
-                    bid_price = parse_bid_price(auctioneer, bidder, msg)
+            if first_msgs is not None:
+                # every bidder is in the first round
+                _bidder_list, _msgs = bidder_list, first_msgs
+                first_msgs = None
+            else:
+                auctioneer_msg = auctioneer.ask_for_bid(bid_round)
+                _bidder_list = []
+                _bid_instruct_list = []
+                # remove highest bidder and withdrawn bidders
+                for bidder in bidder_list:
+                    if bidder is auctioneer.highest_bidder or bidder.withdraw:
+                        bidder.need_input = False
+                        continue
+                    else:
+                        bidder.need_input = True    # enable input from demo
+                        instruct = bidder.get_bid_instruct(auctioneer_msg, bid_round)
+                        _bidder_list.append(bidder)
+                        _bid_instruct_list.append(instruct)
+                
+                if yield_for_demo:
+                    chatbot_list = bidders_to_chatbots(bidder_list)
+                    yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + enable_human_box(bidder_list)
+                
+                _msgs = await abid_round(auctioneer, _bidder_list, _bid_instruct_list, thread_num=thread_num)
+            _bid_prices = await aparse_round_bid_prices(auctioneer, _bidder_list, _msgs)
 
-                # can't bid more than budget or less than previous highest bid
-                while True:
-                    fail_msg = bidder.bid_sanity_check(bid_price, auctioneer.prev_round_max_bid, auctioneer.min_markup_pct)
-                    if fail_msg is None: 
-                        break
+            if not yield_for_demo:
+                # rebids of the round run at the same time, and are recorded in the order of bidders
+                _resolved = await aresolve_round_bids(auctioneer, _bidder_list, _msgs, _bid_prices, thread_num=thread_num)
+                for bidder, (msg, bid_price) in zip(_bidder_list, _resolved):
+                    bidder.set_withdraw(bid_price)
+                    auctioneer.record_bid({'bidder': bidder, 'bid': bid_price, 'raw_msg': msg}, bid_round)
+            else:
+                # the demo shows every rebid and waits for human bidders, one after the other
+                for i, (msg, bidder) in enumerate(zip(_msgs, _bidder_list)):
+                    if bidder.model_name == 'rule':
+                        bid_price = bidder.bid_rule(auctioneer.prev_round_max_bid, auctioneer.min_markup_pct)
+                    elif _bid_prices[i] is None:
+                        bid_price = await arebid_until_clear(auctioneer, bidder)
                     else:
-                        bidder.need_input = True   # enable input from demo
-                        auctioneer_msg = auctioneer.ask_for_rebid(fail_msg=fail_msg, bid_price=bid_price)
-                        rebid_instruct = bidder.get_rebid_instruct(auctioneer_msg)
+                        bid_price = _bid_prices[i]
+
+                    # can't bid more than budget or less than previous highest bid
+                    rebid_cnt = 0
+                    while True:
+                        fail_msg = bidder.bid_sanity_check(bid_price, auctioneer.prev_round_max_bid, auctioneer.min_markup_pct)
+                        if fail_msg is None: 
+                            break
+                        elif rebid_cnt == auctioneer.max_rebids:
+                            bidder.record_fallback('rebid', f'invalid after {rebid_cnt} rebids: {fail_msg}')
+                            bid_price = -1
+                            break
+                        else:
+                            rebid_cnt += 1
+                            bidder.need_input = True   # enable input from demo
+                            auctioneer_msg = auctioneer.ask_for_rebid(fail_msg=fail_msg, bid_price=bid_price)
+                            rebid_instruct = bidder.get_rebid_instruct(auctioneer_msg)
+                        
+                            if yield_for_demo:
+                                chatbot_list = bidders_to_chatbots(bidder_list)
+                                yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + disable_all_box(bidder_list)
                         
+                            msg = await bidder.arebid_for_failure(rebid_instruct)
+                            bid_price = await aparse_bid_price(auctioneer, bidder, msg)
+                    
                         if yield_for_demo:
                             chatbot_list = bidders_to_chatbots(bidder_list)
                             yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + disable_all_box(bidder_list)
-                        
-                        msg = bidder.rebid_for_failure(rebid_instruct)
-                        bid_price = parse_bid_price(auctioneer, bidder, msg)
-                    
-                    if yield_for_demo:
-                        chatbot_list = bidders_to_chatbots(bidder_list)
-                        yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + disable_all_box(bidder_list)
                 
-                bidder.set_withdraw(bid_price)
-                auctioneer.record_bid({'bidder': bidder, 'bid': bid_price, 'raw_msg': msg}, bid_round)
+                    bidder.set_withdraw(bid_price)
+                    auctioneer.record_bid({'bidder': bidder, 'bid': bid_price, 'raw_msg': msg}, bid_round)
             
             if yield_for_demo:
                 chatbot_list = bidders_to_chatbots(bidder_list)
@@ -175,6 +362,8 @@ def run_auction(
                 win_lose_msg=win_lose_msg
             )
             summarize_instruct_list.append(msg)
+            if auctioneer.is_spectator(bidder):
+                bidder.spectator = True     # nothing left to afford
 
         # record profit information of all bidders for each bidder
         # (not used in the auction, just for belief tracking evaluation)
@@ -182,24 +371,44 @@ def run_auction(
         for bidder in bidder_list:
             bidder.set_all_bidders_status(bidder_profit_info)
         
-        bidding_multithread(bidder_list, summarize_instruct_list, func_type='summarize', thread_num=thread_num)
-        
-        if yield_for_demo:
-            chatbot_list = bidders_to_chatbots(bidder_list)
-            yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + disable_all_box(bidder_list)
-
-        # ***************** Replan *****************
-        if len(auctioneer.items_queue) > 0:   # no need to replan if all items are sold
-            replan_instruct_list = [bidder.get_replan_instruct(
-                # bidding_history=auctioneer.all_bidding_history_to_string(), 
-                # hammer_msg=auctioneer.get_hammer_msg()
-                ) for bidder in bidder_list]
-            bidding_multithread(bidder_list, replan_instruct_list, func_type='replan', thread_num=thread_num)
+        if pipeline and len(auctioneer.items_queue) > 0:
+            # ***************** Summarize, Replan and First Bid *****************
+            # the only barrier is the auctioneer waiting for all first bids on the next item
+            auctioneer.hammer_fall()
+            bar.update(1)
+            cur_item = auctioneer.present_item()
+            auctioneer_msg = auctioneer.ask_for_bid(0)
+            first_msgs = await bidding_async(bidder_list, [(msg, auctioneer_msg, auctioneer.is_infeasible(bidder)) 
+                                                           for bidder, msg in zip(bidder_list, summarize_instruct_list)], 
+                                             func_type='summarize_replan_bid', thread_num=thread_num)
+            continue
+        if len(auctioneer.items_queue) > 0 and any(bidder.fused_replan for bidder in bidder_list):
+            # ***************** Summarize and Replan *****************
+            # fused for adaptive planners, one after the other for the rest
+            await bidding_async(bidder_list, summarize_instruct_list, func_type='summarize_replan', thread_num=thread_num)
+            
+            if yield_for_demo:
+                chatbot_list = bidders_to_chatbots(bidder_list)
+                yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + disable_all_box(bidder_list)
+        else:
+            await bidding_async(bidder_list, summarize_instruct_list, func_type='summarize', thread_num=thread_num)
             
             if yield_for_demo:
                 chatbot_list = bidders_to_chatbots(bidder_list)
                 yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + disable_all_box(bidder_list)
 
+            # ***************** Replan *****************
+            if len(auctioneer.items_queue) > 0:   # no need to replan if all items are sold
+                replan_instruct_list = [bidder.get_replan_instruct(
+                    # bidding_history=auctioneer.all_bidding_history_to_string(), 
+                    # hammer_msg=auctioneer.get_hammer_msg()
+                    ) for bidder in bidder_list]
+                await bidding_async(bidder_list, replan_instruct_list, func_type='replan', thread_num=thread_num)
+                
+                if yield_for_demo:
+                    chatbot_list = bidders_to_chatbots(bidder_list)
+                    yield [bidder_list] + chatbot_list + monitor_all(bidder_list) + [auctioneer.log()] + [disable_gr, disable_gr] + disable_all_box(bidder_list)
+
         auctioneer.hammer_fall()
         bar.update(1)
 
@@ -215,7 +424,8 @@ def run_auction(
             'profit': {bidder.name: bidder.profit for bidder in bidder_list},
             'total_cost': total_cost,
             'learnings': {bidder.name: bidder.learnings for bidder in bidder_list},
-            'model_info': {bidder.name: bidder.model_name for bidder in bidder_list}}
+            'model_info': {bidder.name: bidder.model_name for bidder in bidder_list},
+            'bid_parse': auctioneer.parse_stats()}
     log_bidders(log_dir, auction_hash, bidder_list, repeat_num, memo)
     
     auctioneer.finish_auction()
@@ -241,34 +451,114 @@ def make_auction_hash():
     return str(int(time.time()))
 
 
-if __name__ == '__main__':
-    import argparse
-    from src.item_base import create_items
-    from src.bidder_base import create_bidders
-    from transformers import GPT2TokenizerFast
-    # import cjjpy as cjj
-    
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--input_dir', '-i', type=str, default='data/exp_base/')
-    parser.add_argument('--shuffle', action='store_true')
-    parser.add_argument('--repeat', type=int, default=1)
-    parser.add_argument('--threads', '-t', type=int, help='Number of threads. Max is number of bidders. Reduce it if rate limit is low (e.g., GPT-4).', required=True)
-    parser.add_argument('--memo_file', '-m', type=str, help='The last memo.json file to be loaded for learning. Only useful when the repeated auctions are interrupted (i.e., auction hash is different).')
-    args = parser.parse_args()
-    
-    auction_hash = make_auction_hash()
-    
-    total_money_spent = 0
-    for i in tqdm(range(args.repeat), desc='Repeat'):
+def setup_call_layer(args):
+    '''
+    Process-wide settings of LLM calls: response cache, shared rate limits, retries and single flight.
+    '''
+    if args.cache:
+        set_llm_cache(LLMCache(args.cache, mode=args.cache_mode, max_size_mb=args.cache_max_mb, max_age_days=args.cache_max_age_days))
+    if args.rate_limit:
+        set_rate_limiter(RateLimiter(parse_rate_limits(args.rate_limit), lock_dir=args.rate_limit_dir))
+    set_retry_controller(RetryController(max_concurrency=args.max_concurrency, call_timeout=args.call_timeout))
+    set_single_flight(not args.no_single_flight)
+
+
+def call_layer_stats():
+    stats = {}
+    if get_llm_cache() is not None:
+        stats['LLM cache'] = get_llm_cache().stats()
+    stats['LLM concurrency'] = get_retry_controller().stats()
+    stats['Coalesced LLM requests'] = get_single_flight_stats()
+    return stats
+
+
+def merge_call_layer_stats(stats_list: List[dict]):
+    '''
+    Sum the `call_layer_stats` of several processes. Concurrency limits are listed per process.
+    '''
+    merged = {}
+    caches = [stats['LLM cache'] for stats in stats_list if 'LLM cache' in stats]
+    if len(caches) > 0:
+        hits, misses = sum(cache['hits'] for cache in caches), sum(cache['misses'] for cache in caches)
+        merged['LLM cache'] = {
+            'mode': caches[0]['mode'],
+            'hits': hits,
+            'misses': misses,
+            'writes': sum(cache['writes'] for cache in caches),
+            'hit_rate': round(hits / (hits + misses + 1e-8), 4),
+        }
+    concurrency = {}
+    for stats in stats_list:
+        for provider, provider_stats in stats['LLM concurrency'].items():
+            total = concurrency.setdefault(provider, {'limit': [], 'successes': 0, 'rate_limited': 0})
+            total['limit'].append(provider_stats['limit'])
+            total['successes'] += provider_stats['successes']
+            total['rate_limited'] += provider_stats['rate_limited']
+    for total in concurrency.values():
+        total['rate_limit_ratio'] = round(total['rate_limited'] / (total['successes'] + total['rate_limited'] + 1e-8), 4)
+    merged['LLM concurrency'] = concurrency
+    merged['Coalesced LLM requests'] = {key: sum(stats['Coalesced LLM requests'][key] for stats in stats_list) for key in ['leaders', 'coalesced']}
+    return merged
+
+
+def plan_jobs(input_dirs: List[str], repeat: int, memo_file: str = None):
+    '''
+    Split the auctions of the experiment directories into jobs that can run in any order: one per
+    repeat, or one for all repeats of a directory whose bidders learn from the previous repeat's memo.
+    :return: [(input_dir, repeat numbers), ...]
+    '''
+    jobs = []
+    for input_dir in input_dirs:
+        bidder_rows = LoadJsonL(os.path.join(input_dir, 'bidders_demo.jsonl'))
+        if memo_file is None and any(row.get('enable_learning') for row in bidder_rows):
+            jobs.append((input_dir, list(range(repeat))))
+        else:
+            jobs += [(input_dir, [i]) for i in range(repeat)]
+    return jobs
+
+
+def run_repeats(args, auction_hash: str, input_dir: str, repeats: List[int]):
+    '''
+    Run the auctions `repeats` of `input_dir` one after another, with the bidders built from its
+    bidder JSONL and reused across repeats. A failed auction is retried up to 3 times.
+    :return: a report of every finished auction
+    '''
+    reports = []
+    bidders = None
+    for i in tqdm(repeats, desc='Repeat'):
         cnt = 3
         while cnt > 0:
+            if args.seed is not None:
+                random.seed(f'{args.seed}-{i}')     # item shuffles and ties, whichever worker runs it
             try: 
-                item_file = os.path.join(args.input_dir, f'items_demo.jsonl')
-                bidder_file = os.path.join(args.input_dir, f'bidders_demo.jsonl')
-                memo_file = args.memo_file if args.memo_file else f'{args.input_dir}/{auction_hash}/memo-{i-1}.json' # past memo for learning
+                item_file = os.path.join(input_dir, f'items_demo.jsonl')
+                bidder_file = os.path.join(input_dir, f'bidders_demo.jsonl')
+                memo_file = args.memo_file if args.memo_file else f'{input_dir}/{auction_hash}/memo-{i-1}.json' # past memo for learning
                 items = create_items(item_file)
-                bidders = create_bidders(bidder_file, auction_hash=auction_hash)
-                auctioneer = Auctioneer(enable_discount=False)
+                if bidders is None:
+                    bidders = create_bidders(bidder_file, auction_hash=auction_hash, api_base=args.api_base,
+                                             oracle_status=args.oracle_status or None, fused_replan=args.fused_replan or None, lazy_replan=args.lazy_replan or None,
+                                             stream_bid=args.stream_bid or None, structured_bid=args.structured_bid or None,
+                                             max_bid_tokens=args.max_bid_tokens)
+                else:
+                    # reuse the configured bidders and their LLM clients
+                    for bidder in bidders:
+                        bidder.reset()
+                if args.hedge_percentile:
+                    hedge_budget = HedgeBudget(percentile=args.hedge_percentile, max_hedges=args.max_hedges, max_cost=args.max_hedge_cost)
+                    for bidder in bidders:
+                        bidder.hedger = Hedger(hedge_budget)
+                if args.best_of_n:
+                    best_of_n = BestOfN(parse_best_of_n(args.best_of_n), min_failure_rate=args.best_of_n_min_failure_rate)
+                    for bidder in bidders:
+                        bidder.best_of_n = best_of_n
+                deadlines = None
+                if args.phase_timeout or args.auction_timeout:
+                    deadlines = Deadlines(phase_timeout=args.phase_timeout, auction_timeout=args.auction_timeout)
+                    for bidder in bidders:
+                        bidder.deadlines = deadlines
+                auctioneer = Auctioneer(enable_discount=False, parse_model_name=args.parse_model, api_base=args.api_base, fast_parse=not args.no_fast_parse, batch_parse=not args.no_batch_parse, prefilter=not args.no_prefilter, 
+                                        max_rebids=args.max_rebids, deadlines=deadlines)
                 auctioneer.init_items(items)
                 if args.shuffle:
                     auctioneer.shuffle_items()
@@ -276,18 +566,109 @@ if __name__ == '__main__':
                     auction_hash, 
                     auctioneer, 
                     bidders, 
-                    thread_num=min(args.threads, len(bidders)), 
+                    thread_num=min(args.threads, len(bidders)) if args.threads else None, 
                     yield_for_demo=False, 
-                    log_dir=args.input_dir,
+                    log_dir=input_dir,
                     repeat_num=i,
                     memo_file=memo_file,
+                    pipeline=not args.no_pipeline,
                 ))
-                total_money_spent += sum(money_spent)
+                reports.append({'input_dir': input_dir, 'repeat': i, 'money_spent': sum(money_spent)})
+                print(f'Bid parsing of {i}th auction:', auctioneer.parse_stats())
+                print(f'LLM calls skipped for bidders without a valid bid of {i}th auction:', {bidder.name: bidder.skipped_llm_call_cnt for bidder in bidders})
+                if args.best_of_n:
+                    print(f'Best-of-n sampling of {i}th auction:', best_of_n.stats())
+                print(f'Fallbacks of {i}th auction:', {bidder.name: len(bidder.fallback_history) for bidder in bidders})
                 break
             except Exception as e:
                 cnt -= 1
                 print(f"Error in {i}th auction: {e}\n{trace_back(e)}")
                 print(f"Retry {cnt} more times...")
+    return reports
+
+
+def run_job(args, auction_hash: str, input_dir: str, repeats: List[int]):
+    '''
+    `run_repeats` in a worker process.
+    :return: the reports, the worker's process id and its call-layer stats so far
+    '''
+    return run_repeats(args, auction_hash, input_dir, repeats), os.getpid(), call_layer_stats()
+
+
+if __name__ == '__main__':
+    import argparse
+    from src.best_of_n import PHASES
+    from src.llm_cache import CACHE_MODES
+    from src.rate_limiter import DEFAULT_LOCK_DIR
+    # import cjjpy as cjj
+    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input_dir', '-i', type=str, nargs='+', default=['data/exp_base/'], help='Experiment directories, each with an items_demo.jsonl and a bidders_demo.jsonl.')
+    parser.add_argument('--shuffle', action='store_true')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--seed', type=int, help='Seed of item shuffles, ties and the stub LLM (STUB_SEED), to reproduce runs.')
+    parser.add_argument('--workers', '-w', type=int, default=1, help='Processes running independent auctions at the same time: repeats, and the auctions of other experiment directories. Repeats whose bidders learn from the previous one run in order.')
+    parser.add_argument('--threads', '-t', type=int, help='Optional cap on the number of bidders running at a time. By default, in-flight LLM calls adapt to the rate limits of each provider.')
+    parser.add_argument('--max_concurrency', type=int, default=64, help='Upper bound of in-flight LLM calls per provider.')
+    parser.add_argument('--parse_model', type=str, default='gpt-3.5-turbo-0613', help="LLM used by the auctioneer to parse bids. Use 'stub' for offline runs.")
+    parser.add_argument('--api_base', type=str, help='Send OpenAI/Anthropic requests of all bidders and the parser to this base URL, e.g., http://127.0.0.1:8000/v1 of a local stub server (src/stub_server.py).')
+    parser.add_argument('--oracle_status', action='store_true', help='Take the status quo of every bidder from the auctioneer\'s records instead of summarizing it with LLMs. Beliefs are then not tracked.')
+    parser.add_argument('--fused_replan', action='store_true', help='Adaptive planners update their status and replan in one LLM call per item, instead of two.')
+    parser.add_argument('--lazy_replan', action='store_true', help='Adaptive planners replan only after a win that costs much of their budget, after being outbid, or every few items, instead of after every item.')
+    parser.add_argument('--stream_bid', action='store_true', help='Stream bids of all bidders and stop at the decision ("I bid $xxx!" or "I\'m out!"), whose price then needs no parsing.')
+    parser.add_argument('--structured_bid', action='store_true', help='Bidders answer with a decision object (function calling for OpenAI models, JSON otherwise), which needs no parser model.')
+    parser.add_argument('--max_bid_tokens', type=int, help='Cap on the length of every bid response, reasons included.')
+    parser.add_argument('--hedge_percentile', type=float, help='Send a duplicate of an LLM call slower than this percentile of recent latencies of its model (e.g., 95), and take the first response.')
+    parser.add_argument('--max_hedges', type=int, default=50, help='Maximum number of duplicate requests per auction.')
+    parser.add_argument('--max_hedge_cost', type=float, help='Maximum estimated extra cost ($) of duplicate requests per auction.')
+    parser.add_argument('--best_of_n', type=str, nargs='+', help=f'Sample N candidates of a phase in parallel and take the first valid one instead of asking again, as PHASE:N (e.g., summarize:3 rebid:2). Phases: {", ".join(PHASES)}.')
+    parser.add_argument('--best_of_n_min_failure_rate', type=float, default=0., help='Only sample several candidates in a phase once this share of its first candidates failed validation.')
+    parser.add_argument('--call_timeout', type=float, help='Seconds per LLM request, after which it is retried like other timeouts.')
+    parser.add_argument('--phase_timeout', type=float, help='Seconds per phase of a bidder (bid, summarize, replan, ...) or bid parse, retries included. A phase that misses it or fails takes a default action: withdraw, keep the status quo or keep the plan.')
+    parser.add_argument('--auction_timeout', type=float, help='Seconds per auction, after which every phase takes its default action.')
+    parser.add_argument('--max_rebids', type=int, default=3, help='Rebids of an unclear or invalid bid, after which the bidder withdraws.')
+    parser.add_argument('--no_fast_parse', action='store_true', help='Parse every bid with the LLM parser instead of rules first.')
+    parser.add_argument('--no_batch_parse', action='store_true', help='Parse the unsure bids of a round with one LLM request each instead of one request for all.')
+    parser.add_argument('--no_pipeline', action='store_true', help='Wait for all bidders after the summarize and replan phases, instead of letting each bidder go on to its first bid on the next item.')
+    parser.add_argument('--no_prefilter', action='store_true', help='Ask bidders to bid, summarize and replan even when they cannot afford any valid bid.')
+    parser.add_argument('--no_single_flight', action='store_true', help='Send identical temperature-0 requests in flight separately instead of sharing one response.')
+    parser.add_argument('--memo_file', '-m', type=str, help='The last memo.json file to be loaded for learning. Only useful when the repeated auctions are interrupted (i.e., auction hash is different).')
+    parser.add_argument('--cache', type=str, help='SQLite file caching LLM responses across runs, e.g., cache/llm_cache.sqlite.')
+    parser.add_argument('--cache_mode', type=str, default='readwrite', choices=CACHE_MODES, help='read_only: never write new responses. record_only: always call LLMs, but record their responses.')
+    parser.add_argument('--cache_max_mb', type=float, help='Evict least recently used responses when the cache grows beyond this size.')
+    parser.add_argument('--cache_max_age_days', type=float, help='Evict responses older than this.')
+    parser.add_argument('--rate_limit', type=str, action='append', help='Shared rate limit as MODEL_OR_PROVIDER:RPM:TPM (e.g., gpt-4:200:40000), shared by all local processes. Can be repeated.')
+    parser.add_argument('--rate_limit_dir', type=str, default=DEFAULT_LOCK_DIR, help='Directory of the rate-limit bucket files. Processes sharing a quota must use the same one.')
+    args = parser.parse_args()
+    if args.seed is not None:
+        os.environ['STUB_SEED'] = str(args.seed)    # read by stubs when they are built, in workers too
+    
+    auction_hash = make_auction_hash()
+    reports = []
+    if args.workers > 1:
+        # every worker sets up its own call layer, and shares the cache and the rate limits through files
+        worker_stats = {}
+        jobs = plan_jobs(args.input_dir, args.repeat, args.memo_file)
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=setup_call_layer, initargs=(args,)) as pool:
+            futures = {pool.submit(run_job, args, auction_hash, input_dir, repeats): (input_dir, repeats) for input_dir, repeats in jobs}
+            for future in tqdm(as_completed(futures), total=len(futures), desc='Jobs'):
+                try:
+                    job_reports, pid, stats = future.result()
+                except Exception as e:
+                    print(f"Error in the auctions {futures[future]}: {e}\n{trace_back(e)}")
+                    continue
+                reports += job_reports
+                worker_stats[pid] = stats   # running totals of the worker
+        stats = merge_call_layer_stats(list(worker_stats.values()))
+    else:
+        setup_call_layer(args)
+        for input_dir in args.input_dir:
+            reports += run_repeats(args, auction_hash, input_dir, list(range(args.repeat)))
+        stats = call_layer_stats()
     
+    print(f'Finished auctions: {len(reports)}/{len(args.input_dir) * args.repeat}')
+    total_money_spent = sum(report['money_spent'] for report in reports)
     print('Total money spent: $', total_money_spent)
+    for name, stat in stats.items():
+        print(f'{name}:', stat)
     # cjj.SendEmail(f'Completed: {args.input_dir} - {auction_hash}', f'Total money spent: ${total_money_spent}')
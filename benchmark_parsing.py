@@ -0,0 +1,137 @@
+'''
+Microbenchmark of response parsing: the previous character-by-character `extract_jsons_from_text`,
+DOTALL `extract_numbered_list` and case-insensitive bid decision search, against
+`utils.parse_response` (cold and memoized), on large synthetic responses with reasoning,
+numbered lists, status JSONs and bid decisions. Outputs are checked to be the same.
+
+    python benchmark_parsing.py --kb 8 --repeat 3
+'''
+import argparse
+import random
+import re
+import time
+import ujson as json
+from utils import parse_response, extract_jsons_from_text, extract_numbered_list
+from src.bid_parser import parse_bid_decision
+
+
+LEGACY_BID_DECISION_PATTERN = re.compile(r"(?<![\"“'])(?:I bid \$(\d[\d,]*)(?:\.\d+)?!|I['’]m out!)", re.IGNORECASE)
+
+
+def legacy_extract_jsons_from_text(text):
+    json_dicts = []
+    stack = []
+    start_index = None
+
+    for i, char in enumerate(text):
+        if char == '{':
+            stack.append(char)
+            if start_index is None:
+                start_index = i
+        elif char == '}':
+            if stack:
+                stack.pop()
+            if not stack and start_index is not None:
+                json_candidate = text[start_index:i+1]
+                try:
+                    parsed_json = json.loads(json_candidate)
+                    json_dicts.append(parsed_json)
+                    start_index = None
+                except json.JSONDecodeError:
+                    pass
+                finally:
+                    start_index = None
+
+    if len(json_dicts) == 0: json_dicts = [{}]
+    return json_dicts
+
+
+def legacy_extract_numbered_list(paragraph):
+    pattern = r"^\s*(\d+[.)]\s?.*?)(?=\s*\d+[.)]|$)"
+    matches = re.findall(pattern, paragraph, re.DOTALL | re.MULTILINE)
+    return [match.strip() for match in matches]
+
+
+def legacy_parse_bid_decision(text):
+    matches = list(LEGACY_BID_DECISION_PATTERN.finditer(text))
+    if len(matches) == 0:
+        return None
+    price = matches[-1].group(1)
+    return -1 if price is None else int(price.replace(',', ''))
+
+
+def make_response(kb: float, rng: random.Random):
+    bidders = [f'Bidder {i}' for i in range(1, 9)]
+    items = [f'Item {chr(65 + i)}' for i in range(12)]
+    parts = []
+    while sum(len(p) for p in parts) < kb * 1024:
+        kind = rng.random()
+        if kind < 0.4:
+            item = rng.choice(items)
+            parts.append(f"Considering {item}, its estimated value is ${rng.randint(1, 20) * 500} and the current bid is "
+                         f"${rng.randint(1, 10) * 500}; my remaining budget {{after this round}} matters more than one item.")
+        elif kind < 0.7:
+            parts.append('\n'.join(f"{i+1}. Keep a firm ceiling for {rng.choice(items)} and raise by the minimum of ${rng.randint(1, 9) * 100}."
+                                   for i in range(rng.randint(3, 8))))
+        elif kind < 0.9:
+            status = {
+                'remaining_budget': rng.randint(0, 20000),
+                'total_profits': {b: rng.randint(-2000, 5000) for b in bidders},
+                'winning_bids': {b: {rng.choice(items): rng.randint(500, 9000)} for b in bidders},
+            }
+            parts.append(f"```\n{json.dumps(status, indent=4)}\n```")
+        else:
+            parts.append(f"{{'broken': {rng.randint(1, 9)} + {rng.randint(1, 9)}")
+    parts.append(rng.choice(["I bid $1,200!", "I'm out!"]))
+    return '\n\n'.join(parts)
+
+
+def bench(func, texts, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in texts:
+            func(text)
+        best = min(best, time.perf_counter() - start)
+    return best / len(texts) * 1000
+
+
+def legacy_all(text):
+    legacy_extract_jsons_from_text(text)
+    legacy_extract_numbered_list(text)
+    legacy_parse_bid_decision(text)
+
+
+def engine_cold(text):
+    parse_response.cache_clear()
+    parse_response(text)
+
+
+def engine_warm(text):
+    # summarize and replan ask for the same response several times
+    response = parse_response(text)
+    return response.jsons(), response.numbered_list, response.bid_decision
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--kb', type=float, nargs='+', default=[2, 8, 32], help='Sizes of the responses in KB.')
+    parser.add_argument('--num', type=int, default=20, help='Responses per size.')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'size':>8} {'legacy (ms)':>12} {'cold (ms)':>10} {'warm (ms)':>10} {'speedup':>8}")
+    for kb in args.kb:
+        texts = [make_response(kb, rng) for _ in range(args.num)]
+        for text in texts:
+            assert extract_jsons_from_text(text) == legacy_extract_jsons_from_text(text)
+            assert extract_numbered_list(text) == legacy_extract_numbered_list(text)
+            assert parse_response(text).bid_decision == parse_bid_decision(text) == legacy_parse_bid_decision(text)
+        legacy = bench(legacy_all, texts, args.repeat)
+        cold = bench(engine_cold, texts, args.repeat)
+        for text in texts:
+            parse_response(text)
+        warm = bench(engine_warm, texts, args.repeat)
+        print(f"{kb:>6}KB {legacy:>12.3f} {cold:>10.3f} {warm:>10.3f} {legacy / cold:>7.1f}x")
@@ -1,8 +1,6 @@
 import re
 from typing import List, Dict
 from langchain.prompts import PromptTemplate
-from langchain.chat_models import ChatOpenAI
-from langchain.callbacks import get_openai_callback
 from pydantic import BaseModel
 from collections import defaultdict
 from langchain.schema import (
@@ -10,12 +8,18 @@ from langchain.schema import (
     HumanMessage,
     SystemMessage
 )
+import asyncio
 import random
 import inflect
+import ujson as json
 from .bidder_base import Bidder
 from .human_bidder import HumanBidder
+from .bid_parser import FAST_PARSE_THRESHOLD, rule_parse_bid
+from .deadlines import Deadlines
 from .item_base import Item
-from .prompt_base import PARSE_BID_INSTRUCTION
+from .llm_base import acall_llm
+from .llm_clients import get_chat_model
+from .prompt_base import PARSE_BID_INSTRUCTION, PARSE_BIDS_INSTRUCTION
 
 p = inflect.engine()
 
@@ -34,6 +38,18 @@ class Auctioneer(BaseModel):
     min_bid: int = 0
     fail_to_sell = False
     min_markup_pct = 0.1
+    parse_model_name: str = 'gpt-3.5-turbo-0613'   # LLM that parses bids, e.g., 'stub' for offline runs
+    api_base: str = None    # OpenAI-compatible endpoint of the parser, e.g., a local stub server
+    fast_parse: bool = True             # parse canonical bids with rules, and only ask the LLM when unsure
+    fast_parse_threshold: float = FAST_PARSE_THRESHOLD  # minimum confidence of a rule-based parse
+    batch_parse: bool = True            # parse the unsure bids of a round in one LLM request
+    prefilter: bool = True              # withdraw bidders who cannot afford a valid bid without asking their LLMs
+    max_rebids: int = 3                 # rebids of an unclear or invalid bid, after which the bidder withdraws
+    deadlines: Deadlines = None         # deadlines of the LLM parser, shared with the bidders. A parse that misses them is unclear
+    fast_parse_cnt: int = 0
+    llm_parse_cnt: int = 0
+    batch_parse_cnt: int = 0            # LLM requests that parsed several bids at once, not counting failed ones
+    parse_fallback_cnt: int = 0         # LLM parser requests that missed their deadline or failed
 
     class Config:
         arbitrary_types_allowed = True
@@ -172,6 +188,30 @@ class Auctioneer(BaseModel):
         self.prev_round_max_bid = -1
         self.fail_to_sell = False
 
+    def min_valid_bid(self):
+        '''
+        The lowest bid of this round that passes `Bidder.bid_sanity_check`.
+        '''
+        return max(self.cur_item.price, self.prev_round_max_bid + int(self.min_markup_pct * self.cur_item.price))
+
+    def _prefiltered(self, bidder: Bidder):
+        # rule bidders need no LLM, and humans decide for themselves
+        return self.prefilter and bidder.model_name != 'rule' and 'human' not in bidder.model_name
+
+    def is_infeasible(self, bidder: Bidder):
+        '''
+        Whether withdrawing is the only valid action of `bidder` in this round, from its true budget.
+        '''
+        return self._prefiltered(bidder) and bidder.budget < self.min_valid_bid()
+
+    def is_spectator(self, bidder: Bidder):
+        '''
+        Whether `bidder` can afford none of the items left, so that it only watches the rest of the auction.
+        Prices may still drop with discounts.
+        '''
+        return self._prefiltered(bidder) and not self.enable_discount and len(self.items_queue) > 0 \
+            and bidder.budget < min(item.price for item in self.items_queue)
+
     def end_auction(self):
         return len(self.items_queue) == 0
     
@@ -185,11 +225,25 @@ class Auctioneer(BaseModel):
         return status
 
     def parse_bid(self, text: str):
-        prompt = PARSE_BID_INSTRUCTION.format(response=text)
-        with get_openai_callback() as cb:
-            llm = ChatOpenAI(model='gpt-3.5-turbo-0613', temperature=0)
-            result = llm([HumanMessage(content=prompt)]).content
-            self.openai_cost += cb.total_cost
+        return asyncio.run(self.aparse_bid(text))
+
+    def _fast_parse_bid(self, text: str):
+        if self.fast_parse:
+            bid, confidence = rule_parse_bid(text)
+            if bid is not None and confidence >= self.fast_parse_threshold:
+                self.fast_parse_cnt += 1
+                return bid
+        return None
+
+    async def aparse_bid(self, text: str):
+        bid = self._fast_parse_bid(text)
+        if bid is not None:
+            return bid
+        self.llm_parse_cnt += 1
+
+        result = await self._acall_parser(PARSE_BID_INSTRUCTION.format(response=text))
+        if result is None:
+            return None
         
         bid_number = re.findall(r'\$?\d+', result.replace(',', ''))
         # find number in the result
@@ -201,6 +255,74 @@ class Auctioneer(BaseModel):
             print('* Rebid:', text)
             return None
 
+    async def _acall_parser(self, prompt: str):
+        '''
+        The parser LLM's response to `prompt`, or None if it missed the deadlines or failed.
+        '''
+        llm = get_chat_model(self.parse_model_name, temperature=0, api_base=self.api_base)
+        request = acall_llm(llm, [HumanMessage(content=prompt)])
+        if self.deadlines is None:
+            result, cost = await request
+        else:
+            response, why = await self.deadlines.arun(request)
+            if why is not None:
+                self.parse_fallback_cnt += 1
+                print(f'* Parser fell back: {why}')
+                return None
+            result, cost = response
+        self.openai_cost += cost
+        return result
+
+    async def aparse_bids(self, texts: List[str]):
+        '''
+        Parse the bids of a round together: rules first, then one LLM request for all the unsure
+        ones (or concurrent requests if `batch_parse` is off). A bid that cannot be parsed is None.
+        '''
+        bids = [self._fast_parse_bid(text) for text in texts]
+        unsure = [i for i, bid in enumerate(bids) if bid is None]
+        if len(unsure) > 1 and self.batch_parse:
+            results = await self._allm_parse_bids([texts[i] for i in unsure])
+        else:
+            results = await asyncio.gather(*[self.aparse_bid(texts[i]) for i in unsure])
+        for i, bid in zip(unsure, results):
+            bids[i] = bid
+        return bids
+
+    async def _allm_parse_bids(self, texts: List[str]):
+        self.llm_parse_cnt += len(texts)
+
+        responses = '\n\n'.join(f'<response {i+1}>\n{text.strip()}\n</response {i+1}>' for i, text in enumerate(texts))
+        result = await self._acall_parser(PARSE_BIDS_INSTRUCTION.format(n=len(texts), responses=responses))
+        if result is None:
+            return [None] * len(texts)
+
+        try:
+            bids = json.loads(result[result.index('['):result.rindex(']')+1])
+        except ValueError:
+            bids = None
+        if not isinstance(bids, list) or len(bids) != len(texts):
+            # a malformed answer loses the whole batch: parse one by one instead
+            print('* Batch parse failed:', result)
+            self.llm_parse_cnt -= len(texts)
+            return await asyncio.gather(*[self.aparse_bid(text) for text in texts])
+        self.batch_parse_cnt += 1
+
+        parsed = []
+        for text, bid in zip(texts, bids):
+            if isinstance(bid, str):
+                bid = bid.replace('$', '').replace(',', '').strip()
+                bid = int(bid) if re.fullmatch(r'-?\d+', bid) else None
+            elif isinstance(bid, (int, float)) and not isinstance(bid, bool):
+                bid = int(bid)
+            else:
+                bid = None
+            if bid is not None and bid < 0:
+                bid = -1
+            if bid is None:
+                print('* Rebid:', text)
+            parsed.append(bid)
+        return parsed
+
     def log(self, bidder_personal_reports: list = [], show_model_name=True):
         ''' example
         Apparatus H, starting at $1000.
@@ -245,6 +367,16 @@ class Auctioneer(BaseModel):
                 markdown_output += f"\n\n{report}"
         return markdown_output.strip()
     
+    def parse_stats(self):
+        total = self.fast_parse_cnt + self.llm_parse_cnt
+        return {
+            'fast_parse_cnt': self.fast_parse_cnt,
+            'llm_parse_cnt': self.llm_parse_cnt,
+            'batch_parse_cnt': self.batch_parse_cnt,
+            'parse_fallback_cnt': self.parse_fallback_cnt,
+            'fast_parse_ratio': round(self.fast_parse_cnt / (total + 1e-8), 4),
+        }
+
     def finish_auction(self):
         self.auction_logs = defaultdict(list)
         self.cur_item = None
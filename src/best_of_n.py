@@ -0,0 +1,85 @@
+'''
+Best-of-n sampling of LLM outputs that must pass a validator.
+
+Invalid outputs (a status JSON with errors, a plan without priorities, an unclear bid) are
+normally followed by another request, one round trip after the other. Instead, a phase can
+sample n candidates of a request in parallel and take the first one, in candidate order, that
+passes the same validator. `BestOfN` is the per-phase policy shared by the bidders of one
+auction: it decides when the n-1 extra calls are worth it, from how often the first candidates
+of a phase fail, and reports how often the first candidate alone would have been enough.
+'''
+import threading
+from collections import defaultdict
+
+
+PHASES = ['bid', 'rebid', 'summarize', 'replan', 'summarize_replan']
+
+
+def parse_best_of_n(specs: list):
+    '''
+    ['PHASE:N', ...], e.g., ['summarize:3', 'replan:2'] -> {'summarize': 3, 'replan': 2}
+    '''
+    n = {}
+    for spec in specs:
+        phase, num = spec.rsplit(':', 1)
+        assert phase in PHASES, f'phase should be one of {PHASES}'
+        n[phase] = int(num)
+    return n
+
+
+class BestOfN():
+    '''
+    :param n: candidates per request of each phase, e.g., {'summarize': 3}. Other phases sample one.
+    :param min_failure_rate: sample n candidates in a phase only once at least this share of its
+        first candidates failed validation (0 for always)
+    :param min_samples: requests of a phase to observe before trusting its failure rate
+    '''
+    def __init__(self, n: dict, min_failure_rate: float = 0., min_samples: int = 5):
+        self.n = n
+        self.min_failure_rate = min_failure_rate
+        self.min_samples = min_samples
+        self._stats = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+
+    def candidates(self, phase: str):
+        '''
+        The number of candidates to sample for the next request of `phase`.
+        '''
+        n = self.n.get(phase, 1)
+        if n <= 1 or self.min_failure_rate <= 0:
+            return max(n, 1)
+        with self._lock:
+            stats = self._stats[phase]
+            if stats['requests'] < self.min_samples:
+                return 1
+            failure_rate = 1 - stats['first_ok'] / stats['requests']
+        return n if failure_rate >= self.min_failure_rate else 1
+
+    def record(self, phase: str, passed: list):
+        '''
+        :param passed: whether each candidate of a request passed validation, in candidate order
+        '''
+        with self._lock:
+            stats = self._stats[phase]
+            stats['requests'] += 1
+            stats['candidates'] += len(passed)
+            stats['first_ok'] += int(passed[0])
+            stats['any_ok'] += int(any(passed))
+            if len(passed) > 1:
+                stats['sampled'] += 1
+                stats['sampled_first_ok'] += int(passed[0])
+
+    def stats(self):
+        '''
+        Per phase: requests, candidates, how often the first candidate passed and how often any did,
+        and, of the requests that sampled several, how often the first one would have been enough.
+        '''
+        with self._lock:
+            return {phase: {
+                'requests': stats['requests'],
+                'candidates': stats['candidates'],
+                'first_ok_rate': round(stats['first_ok'] / (stats['requests'] + 1e-8), 2),
+                'any_ok_rate': round(stats['any_ok'] / (stats['requests'] + 1e-8), 2),
+                'sampled': stats['sampled'],
+                'first_enough_rate': round(stats['sampled_first_ok'] / (stats['sampled'] + 1e-8), 2),
+            } for phase, stats in self._stats.items()}
@@ -0,0 +1,139 @@
+'''
+Rule-based parsing of bid decisions.
+
+Bidders are asked to end with "I bid $xxx!" or "I'm out!". `rule_parse_bid` reads those and
+their common variants (commas, "k" suffixes, "withdraw", "my bid is ...") without an LLM,
+with a confidence so that the auctioneer only asks its LLM parser when the rules cannot decide.
+The last decision in a response wins, as with the LLM parser, unless an earlier one is more
+explicit. Conditional decisions ("I'll withdraw if ...") do not count as decisions, and a
+response that both bids and withdraws is left to the LLM parser.
+
+In the structured bid mode, bidders answer with a decision object (`BID_FUNCTION`) instead,
+which `parse_structured_bid` validates without any parser.
+'''
+import re
+import ujson as json
+
+
+# never ends inside a malformed digit group, e.g., "$1,2000" is not $1
+AMOUNT = r'\$?\s?((?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?)(?![,.]?\d)\s?(k|K|thousand)?\b'
+NOT_QUOTED = r'(?<!["“\'])'
+
+# minimum confidence of a rule-based parse to skip the LLM parser
+FAST_PARSE_THRESHOLD = 0.8
+
+# a final decision, not one quoted in the reasoning. case-insensitive, but spelled out so that
+# searches jump from "I" to "I" instead of trying every position.
+BID_DECISION_PATTERN = re.compile(r"[Ii](?<![\"“'][Ii])(?: [Bb][Ii][Dd] \$(\d[\d,]*)(?:\.\d+)?!|['’][Mm] [Oo][Uu][Tt]!)")
+
+# (pattern, is withdrawal, confidence)
+DECISION_RULES = [
+    (re.compile(NOT_QUOTED + r"\bI bid " + AMOUNT + r"\s?!"), False, 1.),
+    (re.compile(NOT_QUOTED + r"\bI['’]m out!"), True, 1.),
+    (re.compile(NOT_QUOTED + r"\bI bid " + AMOUNT, re.IGNORECASE), False, .9),
+    (re.compile(NOT_QUOTED + r"\bI(?:['’]m| am) out\b(?! of (?:my )?(?:budget|money|funds))", re.IGNORECASE), True, .9),
+    (re.compile(r"\b(?:I(?:['’]ll|['’]d| will| would| shall)? (?:like to |want to |choose to |decide to |have to |must )?"
+                r"(?:bid|offer|raise (?:my bid |the bid )?to|increase (?:my bid )?to|place a bid of)"
+                r"|my (?:new |final |next )?bid (?:is|will be|of)) " + AMOUNT, re.IGNORECASE), False, .8),
+    (re.compile(r"\bI(?:['’]ll|['’]d| will| would| shall)? (?:like to |want to |choose to |decide to |have to |must |have decided to )?"
+                r"(?:withdraw|pass(?! on\b| up\b)|fold|drop out|step back|stop bidding)\b", re.IGNORECASE), True, .8),
+]
+NEGATION = re.compile(r"\b(?:not|never|won['’]t|don['’]t|can['’]t|shouldn['’]t|wouldn['’]t|no longer)\b[^.!?]{0,12}$", re.IGNORECASE)
+# a condition before a decision, in its sentence and not closed by a "but"
+CONDITIONAL = re.compile(r"(?:^|[.!?\n])[^.!?\n]*\b(?:if|unless|should the|once|in case)\b(?:(?!\bbut\b)[^.!?\n])*$", re.IGNORECASE)
+# a condition after a decision, in the rest of its clause
+CONDITIONAL_AFTER = re.compile(r"^[^.!?\n]*\b(?:if|unless|only|would)\b", re.IGNORECASE)
+
+
+# decision object of the structured bid mode, as an OpenAI function
+BID_FUNCTION = {
+    'name': 'place_bid',
+    'description': 'Bid on the current item or withdraw from its bidding.',
+    'parameters': {
+        'type': 'object',
+        'properties': {
+            'rationale': {'type': 'string', 'description': 'Your reasons for the decision, given before it.'},
+            'action': {'type': 'string', 'enum': ['bid', 'withdraw']},
+            'amount': {'type': 'integer', 'description': 'The bid in dollars, higher than the current highest bid. 0 if you withdraw.'},
+        },
+        'required': ['rationale', 'action', 'amount'],
+    },
+}
+
+
+def _amount(number: str, suffix: str = None):
+    amount = float(number.replace(',', ''))
+    if suffix:
+        amount *= 1000
+    return int(amount)
+
+
+def parse_bid_decision(text: str):
+    '''
+    Return the price of the last "I bid $xxx!" (-1 for "I'm out!") in the text, or None if there is no decision.
+    '''
+    matches = list(BID_DECISION_PATTERN.finditer(text))
+    if len(matches) == 0:
+        return None
+    price = matches[-1].group(1)
+    return -1 if price is None else int(price.replace(',', ''))
+
+
+def rule_parse_bid(text: str):
+    '''
+    :return: (bid, confidence). The bid is -1 for a withdrawal, and None (confidence 0) if no decision is found.
+    '''
+    decisions = []     # (start, bid, confidence)
+    for pattern, is_withdrawal, rule_confidence in DECISION_RULES:
+        for m in pattern.finditer(text):
+            before = text[:m.start()]
+            if NEGATION.search(before):
+                continue
+            confidence = rule_confidence
+            after = '' if m.group(0).endswith('!') else text[m.end():]
+            if CONDITIONAL.search(before) or CONDITIONAL_AFTER.search(after):
+                confidence = min(confidence, .4)   # "if it goes above $500, I'm out"
+            bid = -1 if is_withdrawal else _amount(m.group(1), m.group(2))
+            decisions.append((m.start(), bid, confidence))
+    if len(decisions) == 0:
+        return None, 0.
+    # the last of the most explicit decisions wins, the more explicit rule on ties
+    best = max(confidence for _, _, confidence in decisions)
+    start, bid, confidence = max((d for d in decisions if d[2] == best), key=lambda d: d[0])
+    # a bid and a withdrawal, neither of them conditional: the LLM parser decides
+    decided = {d[1] < 0 for d in decisions if d[2] >= FAST_PARSE_THRESHOLD}
+    if len(decided) > 1:
+        confidence = min(confidence, .5)
+    return bid, confidence
+
+
+def parse_structured_bid(text: str):
+    '''
+    Validate a decision object of the structured bid mode, as JSON in `text`.
+    :return: (bid, rationale). The bid is -1 for a withdrawal, and None if the object is invalid.
+    '''
+    try:
+        decision = json.loads(text[text.index('{'):text.rindex('}')+1])
+    except ValueError:
+        return None, ''
+    if not isinstance(decision, dict):
+        return None, ''
+    rationale = str(decision.get('rationale') or '').strip()
+    action = str(decision.get('action') or '').strip().lower()
+    if action == 'withdraw':
+        return -1, rationale
+    amount = decision.get('amount')
+    if isinstance(amount, str):
+        amount = amount.replace('$', '').replace(',', '').strip()
+        amount = int(amount) if amount.isdigit() else None
+    if action != 'bid' or isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0:
+        return None, rationale
+    return int(amount), rationale
+
+
+def render_bid_decision(bid: int, rationale: str = ''):
+    '''
+    The free-text form of a decision, as bidders say it in the original setup.
+    '''
+    decision = "I'm out!" if bid < 0 else f"I bid ${bid}!"
+    return f"{rationale} {decision}".strip()
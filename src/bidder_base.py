@@ -5,25 +5,31 @@ from langchain.schema import (
     HumanMessage,
     SystemMessage
 )
-from langchain.chat_models import (
-    ChatAnthropic,
-    ChatOpenAI,
-    ChatVertexAI,
-    ChatGooglePalm,
-)
+from langchain.chat_models import ChatVertexAI
 import vertexai
 from langchain.input import get_colored_text
-from langchain.callbacks import get_openai_callback
 from collections import defaultdict
 from pydantic import BaseModel
+import asyncio
+import contextlib
 import queue
 import threading
+import traceback
 import os
 import random
+import re
 import time
 import ujson as json
 import matplotlib.pyplot as plt
+from .best_of_n import BestOfN
+from .deadlines import Deadlines
+from .bid_parser import BID_DECISION_PATTERN, BID_FUNCTION, FAST_PARSE_THRESHOLD, parse_structured_bid, render_bid_decision, rule_parse_bid
 from .item_base import Item, item_list_equal
+from .llm_base import acall_llm
+from .llm_clients import get_chat_model
+from .llm_hedge import Hedger
+from .json_repair import repair_json
+from .token_counter import count_tokens
 from .prompt_base import (
     AUCTION_HISTORY,
     # INSTRUCT_OBSERVE_TEMPLATE,
@@ -33,11 +39,13 @@ from .prompt_base import (
     INSTRUCT_SUMMARIZE_TEMPLATE,
     INSTRUCT_LEARNING_TEMPLATE,
     INSTRUCT_REPLAN_TEMPLATE,
+    INSTRUCT_SUMMARIZE_REPLAN_TEMPLATE,
+    STRUCTURED_BID_INSTRUCTION,
     SYSTEM_MESSAGE,
 )
 import sys
 sys.path.append('..')
-from utils import LoadJsonL, extract_jsons_from_text, extract_numbered_list, trace_back
+from utils import LoadJsonL, extract_jsons_from_text, extract_numbered_list, parse_response, trace_back
 
 
 # DESIRE_DESC = {
@@ -53,6 +61,14 @@ DESIRE_DESC = {
 }
 
 
+# kept by `Bidder.reset()`, everything else is the state of one auction
+BIDDER_CONFIG_FIELDS = [
+    'name', 'model_name', 'budget', 'original_budget', 'desire', 'plan_strategy', 'temperature', 
+    'overestimate_percent', 'correct_belief', 'enable_learning', 'oracle_status', 'fused_replan', 'lazy_replan', 'replan_every', 'replan_budget_drop_percent', 'stream_bid', 'structured_bid', 'max_bid_tokens', 
+    'llm', 'api_base', 'hedger', 'best_of_n', 'deadlines', 'verbose', 'auction_hash', 'max_bid_cnt', 'human_name',
+]
+
+
 class Bidder(BaseModel):
     name: str
     model_name: str 
@@ -63,8 +79,20 @@ class Bidder(BaseModel):
     overestimate_percent: int = 10
     correct_belief: bool
     enable_learning: bool = False
+    oracle_status: bool = False     # take the status quo from the auctioneer's records instead of summarizing it with the LLM (no belief tracking)
+    fused_replan: bool = False      # adaptive planners update the status and replan in one LLM call
+    lazy_replan: bool = False       # adaptive planners replan only when `replan_trigger` fires, and keep their plan otherwise
+    replan_every: int = 3           # lazy replanning: at least once every N items (0 for never)
+    replan_budget_drop_percent: int = 10    # lazy replanning: when the budget dropped by more than this since the last plan
+    stream_bid: bool = False        # stream bids and stop at the decision ("I bid $xxx!" or "I'm out!")
+    structured_bid: bool = False    # bid with a decision object (function calling for OpenAI, JSON otherwise) that needs no parsing
+    max_bid_tokens: int = None      # cap on the length of a bid response, reasons included
     
     llm: BaseLanguageModel = None
+    api_base: str = None    # OpenAI/Anthropic-compatible endpoint, e.g., a local stub server (stub_server.py)
+    hedger: Hedger = None   # duplicates slow LLM calls, drawing from a budget shared by the auction
+    best_of_n: BestOfN = None   # samples several candidates of outputs that must pass validation, per phase, shared by the auction
+    deadlines: Deadlines = None     # deadlines of phases and of the auction, shared by the auction. Phases that miss them take a default action
     openai_cost = 0
     llm_token_count = 0
     
@@ -84,8 +112,16 @@ class Bidder(BaseModel):
     bid_history: list = []      # history of the bidding of a single item
     plan_instruct: str = ''     # instruction for planning
     cur_plan: str = ''          # current plan
+    plan_item_id: int = 0       # id of the first item of the current plan
+    plan_budget: int = 0        # budget when the current plan was made
+    plan_kept: bool = False     # the current plan was carried forward to this item, so it has not seen the latest status quo
+    replan_skip_cnt: int = 0    # replans skipped by lazy replanning
+    spectator: bool = False     # can afford none of the items left: no more LLM calls in this auction
+    skipped_llm_call_cnt: int = 0   # LLM calls saved by withdrawing infeasible bids and by spectating
+    fallback_history: list = []     # [item, phase, why] of phases that took their default action after a deadline or a failure
     status_quo: dict = {}       # belief of budget and profit, self and others
     withdraw: bool = False      # state of withdraw
+    parsed_bid: tuple = None    # (response, price) of the last bid whose decision is known: caught while streaming, or structured
     learnings: str = ''         # learnings from previous biddings. If given, then use it to guide the rest of the auction.
     max_bid_cnt: int = 4        # Rule Bidder: maximum number of bids on one item (K = 1 starting bid + K-1 increase bid)
     rule_bid_cnt: int = 0       # Rule Bidder: count of bids on one item
@@ -98,6 +134,9 @@ class Bidder(BaseModel):
     other_belief_error_cnt: int = 0
     total_other_belief_cnt: int = 0
     
+    json_repair_cnt: int = 0        # JSON responses that needed a local repair
+    json_repaired_cnt: int = 0      # ... and passed the checks after it, saving a revision call
+    
     engagement_count: int = 0
     budget_history = []
     profit_history = []
@@ -128,8 +167,20 @@ class Bidder(BaseModel):
         instance._post_init()
         return instance
 
+    def reset(self):
+        '''
+        Clear the state of the last auction so that the bidder can join a new one.
+        The configuration and the LLM client are kept.
+        '''
+        for name, field in self.__fields__.items():
+            if name not in BIDDER_CONFIG_FIELDS:
+                setattr(self, name, field.get_default())
+        self.budget = self.original_budget
+        self._post_init()
+
     def _post_init(self):
         self.original_budget = self.budget
+        self.plan_budget = self.budget
         self.system_message = SYSTEM_MESSAGE.format(
             name=self.name,
             desire_desc=DESIRE_DESC[self.desire],
@@ -143,16 +194,11 @@ class Bidder(BaseModel):
         self.profit_history.append(self.profit)
 
     def _parse_llm(self):
-        if 'gpt-' in self.model_name:
-            self.llm = ChatOpenAI(model=self.model_name, temperature=self.temperature, max_retries=30, request_timeout=1200)
-        elif 'claude' in self.model_name:
-            self.llm = ChatAnthropic(model=self.model_name, temperature=self.temperature, default_request_timeout=1200)
-        elif 'bison' in self.model_name:
-            self.llm = ChatGooglePalm(model_name=f'models/{self.model_name}', temperature=self.temperature)
-        elif 'rule' in self.model_name or 'human' in self.model_name:
+        if 'rule' in self.model_name or 'human' in self.model_name:
             self.llm = None
         else:
-            raise NotImplementedError(self.model_name)
+            # shared with other bidders of the same model and settings
+            self.llm = get_chat_model(self.model_name, self.temperature, self.api_base)
     
     # def _rotate_openai_org(self):
     #     # use two organizations to avoid rate limit
@@ -162,38 +208,80 @@ class Bidder(BaseModel):
     #         return None
     
     def _run_llm_standalone(self, messages: list):
-        
-        with get_openai_callback() as cb:
-            for i in range(6):
-                try:
-                    input_token_num = self.llm.get_num_tokens_from_messages(messages)
-                    if 'claude' in self.model_name:     # anthropic's claude
-                        result = self.llm(messages, max_tokens_to_sample=2048)
-                    elif 'bison' in self.model_name:    # google's palm-2
-                        max_tokens = min(max(3900 - input_token_num, 192), 2048)
-                        if isinstance(self.llm, ChatVertexAI):
-                            result = self.llm(messages, max_output_tokens=max_tokens)
-                        else:
-                            result = self.llm(messages)
-                    elif 'gpt' in self.model_name:      # openai
-                        if 'gpt-3.5-turbo' in self.model_name and '16k' not in self.model_name:
-                            max_tokens = max(3900 - input_token_num, 192)
-                        else:
-                            # gpt-4
-                            # self.llm.openai_organization = self._rotate_openai_org()
-                            max_tokens = max(8000 - input_token_num, 192)
-                        result = self.llm(messages, max_tokens=max_tokens)
-                    elif 'llama' in self.model_name.lower():
-                        raise NotImplementedError
-                    else:
-                        raise NotImplementedError
-                    break
-                except:
-                    print(f'Retrying for {self.model_name} ({i+1}/6), wait for {2**(i+1)} sec...')
-                    time.sleep(2**(i+1))
-            self.openai_cost += cb.total_cost
-            self.llm_token_count = self.llm.get_num_tokens_from_messages(messages)
-        return result.content
+        return asyncio.run(self._arun_llm_standalone(messages))
+
+    async def _arun_llm_standalone(self, messages: list, max_tokens: int = None, stop_pattern: re.Pattern = None, sample: int = 0, **kwargs):
+        '''
+        :param max_tokens: optional cap on the response length, below the model's own limit
+        :param stop_pattern: stream the response and stop right after the first match
+        :param sample: index of an independent sample of the same request (best-of-n)
+        :param kwargs: extra request parameters, e.g., functions of OpenAI models
+        '''
+        cap = max_tokens or float('inf')
+        input_token_num = count_tokens(self.llm, messages)
+        if 'claude' in self.model_name:     # anthropic's claude
+            llm_kwargs = {'max_tokens_to_sample': min(2048, cap)}
+        elif 'bison' in self.model_name:    # google's palm-2
+            max_tokens = min(max(3900 - input_token_num, 192), 2048, cap)
+            if isinstance(self.llm, ChatVertexAI):
+                llm_kwargs = {'max_output_tokens': max_tokens}
+            else:
+                llm_kwargs = {}
+        elif 'gpt' in self.model_name:      # openai
+            if 'gpt-3.5-turbo' in self.model_name and '16k' not in self.model_name:
+                max_tokens = max(3900 - input_token_num, 192)
+            else:
+                # gpt-4
+                # self.llm.openai_organization = self._rotate_openai_org()
+                max_tokens = max(8000 - input_token_num, 192)
+            llm_kwargs = {'max_tokens': min(max_tokens, cap)}
+        elif 'stub' in self.model_name:     # offline scripted responses
+            llm_kwargs = {} if max_tokens is None else {'max_tokens': max_tokens}
+            if sample:
+                llm_kwargs['sample_seed'] = sample  # scripted samples differ too
+        elif 'llama' in self.model_name.lower():
+            raise NotImplementedError
+        else:
+            raise NotImplementedError
+        llm = self.llm
+        if llm._llm_type == 'anthropic-chat':
+            # its connection pool is bound to an event loop: take the client of the running one
+            llm = get_chat_model(self.model_name, self.temperature, self.api_base)
+        # retries, backoff and concurrency are handled by the call layer
+        result, cost = await acall_llm(llm, messages, stop_pattern=stop_pattern, hedger=self.hedger, sample=sample, **llm_kwargs, **kwargs)
+        self.openai_cost += cost
+        self.llm_token_count = input_token_num
+        return result
+
+    async def _arun_llm_best_of(self, messages: list, phase: str, validate, **kwargs):
+        '''
+        A response to `messages`. With best-of-n sampling in `phase`, candidates are sampled in
+        parallel and the first one that passes `validate` is taken (the first one if none does).
+        '''
+        if self.best_of_n is None:
+            return await self._arun_llm_standalone(messages, **kwargs)
+        n = self.best_of_n.candidates(phase)
+        candidates = await asyncio.gather(*[self._arun_llm_standalone(messages, sample=i, **kwargs) for i in range(n)])
+        passed = [validate(candidate) for candidate in candidates]
+        self.best_of_n.record(phase, passed)
+        return candidates[passed.index(True)] if any(passed) else candidates[0]
+
+    async def _awith_deadline(self, phase: str, coro, fallback):
+        '''
+        Await `coro`, a phase of this bidder, within the deadlines. If it misses them or fails,
+        the default action `fallback()` is taken instead and recorded.
+        '''
+        if self.deadlines is None:
+            return await coro
+        result, why = await self.deadlines.arun(coro)
+        if why is None:
+            return result
+        self.record_fallback(phase, why)
+        return fallback()
+
+    def record_fallback(self, phase: str, why: str):
+        self.fallback_history.append([f"{self.cur_item_id + 1} ({self._get_cur_item('name')})", phase, why])
+        print(f"* {self.name} fell back in {phase}: {why}")
 
     def _get_estimated_value(self, item):
         value = item.true_value * (1 + self.overestimate_percent / 100)
@@ -237,6 +325,9 @@ class Bidder(BaseModel):
     # ********** Main Instructions and Functions ********** #
     
     def learn_from_prev_auction(self, past_learnings, past_auction_log):
+        return asyncio.run(self.alearn_from_prev_auction(past_learnings, past_auction_log))
+
+    async def alearn_from_prev_auction(self, past_learnings, past_auction_log):
         if not self.enable_learning or 'rule' in self.model_name or 'human' in self.model_name:
             return ''
         
@@ -244,7 +335,7 @@ class Bidder(BaseModel):
             past_auction_log=past_auction_log,
             past_learnings=past_learnings)
 
-        result = self._run_llm_standalone([HumanMessage(content=instruct_learn)])
+        result = await self._arun_llm_standalone([HumanMessage(content=instruct_learn)])
         self.dialogue_history += [
             HumanMessage(content=instruct_learn),
             AIMessage(content=result),
@@ -295,6 +386,9 @@ class Bidder(BaseModel):
         return plan_instruct
     
     def init_plan(self, plan_instruct: str):
+        return asyncio.run(self.ainit_plan(plan_instruct))
+
+    async def ainit_plan(self, plan_instruct: str):
         '''
         Plan for bidding with auctioneer's instruction and items information for customize estimated value.
         plan = plan(system_message, instruct_plan)
@@ -322,7 +416,8 @@ class Bidder(BaseModel):
         system_msg = SystemMessage(content=self.system_message)
         plan_msg = HumanMessage(content=plan_instruct)
         messages = [system_msg, plan_msg]
-        result = self._run_llm_standalone(messages)
+        # no plan to bid with if it fails
+        result = await self._awith_deadline('plan', self._arun_llm_standalone(messages), lambda: '')
         
         if self.verbose:
             print(get_colored_text(plan_msg.content, 'red'))
@@ -368,9 +463,12 @@ class Bidder(BaseModel):
             desire_desc=DESIRE_DESC[self.desire],
             learning_statement='' if not self.enable_learning else _LEARNING_STATEMENT
         )
+        if self.max_bid_tokens is not None:
+            bid_instruct += f" Keep your reasons within {int(self.max_bid_tokens * 0.6)} words so that you can finish with your decision."
         if bid_round == 0:
-            if self.plan_strategy in ['static', 'none']:
+            if self.plan_strategy in ['static', 'none'] or self.plan_kept:
                 # if static planner, then no replanning is needed. status quo is updated in replanning. thus need to add status quo in bid instruct.
+                # the same for a plan kept from an earlier item.
                 bid_instruct = f"""The status quo of this auction so far is:\n"{json.dumps(self.status_quo, indent=4)}"\n\n{bid_instruct}\n---\n"""
         else:
             bid_instruct = f'Now, the auctioneer says: "{auctioneer_msg}"'
@@ -411,13 +509,20 @@ class Bidder(BaseModel):
         return msg
     
     def bid(self, bid_instruct):
+        return asyncio.run(self.abid(bid_instruct))
+
+    async def abid(self, bid_instruct, phase: str = 'bid'):
         '''
         Bid for an item with auctioneer's instruction and bidding history.
         bid_history = bid(system_message, instruct_plan, plan, bid_history)
+        :param phase: 'bid', or 'rebid' after an unclear decision, for best-of-n sampling
         '''
         if self.model_name == 'rule':
             return ''
-        
+        # withdraw if it fails
+        return await self._awith_deadline(phase, self._abid(bid_instruct, phase), lambda: self._record_withdrawal(bid_instruct, "I'm out!"))
+
+    async def _abid(self, bid_instruct, phase: str):
         bid_msg = HumanMessage(content=bid_instruct)
         
         if self.plan_strategy == 'none':
@@ -430,7 +535,17 @@ class Bidder(BaseModel):
         self.bid_history += [bid_msg]
         messages += self.bid_history
         
-        result = self._run_llm_standalone(messages)
+        self.parsed_bid = None
+        if self.structured_bid:
+            result = await self._arun_structured_bid(messages)
+        elif self.stream_bid:
+            result = await self._arun_llm_standalone(messages, max_tokens=self.max_bid_tokens, stop_pattern=BID_DECISION_PATTERN)
+            bid_price = parse_response(result).bid_decision
+            if bid_price is not None:
+                self.parsed_bid = (result, bid_price)
+        else:
+            # clear enough for the rules of the auctioneer
+            result = await self._arun_llm_best_of(messages, phase, lambda text: rule_parse_bid(text)[1] >= FAST_PARSE_THRESHOLD, max_tokens=self.max_bid_tokens)
         
         self.bid_history += [AIMessage(content=result)]
 
@@ -454,6 +569,53 @@ class Bidder(BaseModel):
         
         return result
 
+    async def _arun_structured_bid(self, messages: list):
+        '''
+        Ask for a decision object and return it in free text, as the rest of the auction expects.
+        An invalid object is returned as it is, for the auctioneer to parse.
+        '''
+        if self.llm._llm_type == 'openai-chat':
+            result = await self._arun_llm_standalone(messages, max_tokens=self.max_bid_tokens, 
+                                                     functions=[BID_FUNCTION], function_call={'name': BID_FUNCTION['name']})
+        else:
+            messages = messages[:-1] + [HumanMessage(content=f"{messages[-1].content}\n\n{STRUCTURED_BID_INSTRUCTION}")]
+            result = await self._arun_llm_standalone(messages, max_tokens=self.max_bid_tokens)
+        bid_price, rationale = parse_structured_bid(result)
+        if bid_price is None:
+            return result
+        result = render_bid_decision(bid_price, rationale)
+        self.parsed_bid = (result, bid_price)
+        return result
+
+    def withdraw_without_llm(self, bid_instruct: str):
+        '''
+        Withdraw when the budget cannot cover any valid bid, which leaves nothing to ask the LLM.
+        The synthetic response is kept in the histories like a real one.
+        '''
+        result = f"My remaining budget of ${self.budget} cannot cover a valid bid on {self._get_cur_item('name')}, so I'm out!"
+        self.skipped_llm_call_cnt += 1
+        return self._record_withdrawal(bid_instruct, result)
+
+    def _record_withdrawal(self, bid_instruct: str, result: str):
+        # a withdrawal without a (finished) LLM call, in the histories like a real one
+        if len(self.bid_history) == 0 or self.bid_history[-1].type != 'human' or self.bid_history[-1].content != bid_instruct:
+            self.bid_history += [HumanMessage(content=bid_instruct)]
+        self.bid_history += [AIMessage(content=result)]
+        self.dialogue_history += [
+            HumanMessage(content=''),
+            AIMessage(content=result)
+        ]
+        self.parsed_bid = (result, -1)
+        return result
+
+    def get_parsed_bid_price(self, bid_msg: str):
+        '''
+        The bid price of `bid_msg` if its decision is already known (streamed or structured), else None.
+        '''
+        if self.parsed_bid is not None and self.parsed_bid[0] == bid_msg:
+            return self.parsed_bid[1]
+        return None
+
     def get_summarize_instruct(self, bidding_history: str, hammer_msg: str, win_lose_msg: str):
         instruct = INSTRUCT_SUMMARIZE_TEMPLATE.format(
             cur_item=self._get_cur_item(), 
@@ -466,6 +628,9 @@ class Bidder(BaseModel):
         return instruct
 
     def summarize(self, instruct_summarize: str):
+        return asyncio.run(self.asummarize(instruct_summarize))
+
+    async def asummarize(self, instruct_summarize: str):
         '''
         Update belief/status quo
         status_quo = summarize(system_message, bid_history, prev_status + instruct_summarize)
@@ -477,12 +642,20 @@ class Bidder(BaseModel):
             self.rule_bid_cnt = 0   # reset bid count for rule bidder
             return ''
         
+        if self.oracle_status or self.spectator:
+            self.status_quo = self._oracle_status_quo()
+            self.skipped_llm_call_cnt += int(self.spectator and not self.oracle_status)
+            return json.dumps(self.status_quo)
+        # keep the previous status quo if it fails
+        return await self._awith_deadline('summarize', self._asummarize(instruct_summarize), lambda: json.dumps(self.status_quo))
+
+    async def _asummarize(self, instruct_summarize: str):
         messages = [SystemMessage(content=self.system_message)]
         # messages += self.bid_history
         summ_msg = HumanMessage(content=instruct_summarize)
         messages.append(summ_msg)
 
-        status_quo_text = self._run_llm_standalone(messages)
+        status_quo_text = await self._arun_llm_best_of(messages, 'summarize', self._valid_status_text)
         
         self.dialogue_history += [summ_msg, AIMessage(content=status_quo_text)]
         self.bid_history += [summ_msg, AIMessage(content=status_quo_text)]
@@ -494,15 +667,9 @@ class Bidder(BaseModel):
         })
 
         cnt = 0
+        status_json = self._extract_json(status_quo_text, self._sanity_check_status_json)
         while cnt <= 3:
-            sanity_msg = self._sanity_check_status_json(extract_jsons_from_text(status_quo_text)[-1])
-            if sanity_msg == '':
-                # pass sanity check then track beliefs
-                consistency_msg = self._belief_tracking(status_quo_text)
-            else:
-                sanity_msg = f'- {sanity_msg}'
-                consistency_msg = ''
-                
+            sanity_msg, consistency_msg = self._check_status(status_json)
             if sanity_msg != '' or (consistency_msg != '' and self.correct_belief):
                 err_msg = f"As {self.name}, here are some error(s) of your summary of the status JSON:\n{sanity_msg.strip()}\n{consistency_msg.strip()}\n\nPlease revise the status JSON based on the errors. Don't apologize. Just give me the revised status JSON.".strip()
                 
@@ -512,16 +679,17 @@ class Bidder(BaseModel):
                 
                 messages += [AIMessage(content=status_quo_text), 
                              HumanMessage(content=err_msg)]
-                status_quo_text = self._run_llm_standalone(messages)
+                status_quo_text = await self._arun_llm_standalone(messages)
                 self.dialogue_history += [
                     HumanMessage(content=err_msg),
                     AIMessage(content=status_quo_text),
                 ]
+                status_json = self._extract_json(status_quo_text, self._sanity_check_status_json)
                 cnt += 1
             else:
                 break
         
-        self.status_quo = extract_jsons_from_text(status_quo_text)[-1]
+        self.status_quo = status_json
 
         if self.verbose:
             print(get_colored_text(instruct_summarize, 'blue'))
@@ -531,6 +699,53 @@ class Bidder(BaseModel):
         
         return status_quo_text
     
+    def _check_status(self, status_json: dict, track: bool = True):
+        '''
+        :return: the sanity error and, for a sane status, the belief errors (tracked in the metrics unless not `track`)
+        '''
+        sanity_msg = self._sanity_check_status_json(status_json)
+        if sanity_msg == '':
+            # pass sanity check then track beliefs
+            consistency_msg = self._belief_tracking(status_json, track)
+        else:
+            sanity_msg = f'- {sanity_msg}'
+            consistency_msg = ''
+        return sanity_msg, consistency_msg
+
+    def _valid_status_text(self, text: str):
+        # whether a status response needs no revision, without tracking it
+        status_json = self._extract_json(text, self._sanity_check_status_json, track=False)
+        sanity_msg, consistency_msg = self._check_status(status_json, track=False)
+        return sanity_msg == '' and (consistency_msg == '' or not self.correct_belief)
+
+    def _oracle_status_quo(self):
+        '''
+        The exact status quo, from the status of all bidders set by the auctioneer.
+        '''
+        return {
+            'remaining_budget': self.budget,
+            'total_profits': {bidder: status['profit'] for bidder, status in self.all_bidders_status.items()},
+            'winning_bids': {bidder: {str(item): bid for item, bid in status['items_won']} for bidder, status in self.all_bidders_status.items()},
+        }
+    
+    def replan_trigger(self):
+        '''
+        Why the current plan needs replanning after the current item, or '' if it still holds.
+        Adaptive planners replan after every item, lazy ones only on these events.
+        '''
+        if not self.lazy_replan:
+            return 'every item'
+        if self.plan_budget - self.budget > self.plan_budget * self.replan_budget_drop_percent / 100:
+            return 'budget drop'
+        item_name = self._get_cur_item('name')
+        won = len(self.items_won) > 0 and self.items_won[-1][0] is self._get_cur_item()
+        priority = extract_jsons_from_text(self.cur_plan)[-1].get(item_name, 0)
+        if not won and self.engagement_history.get(item_name, 0) > 0 and priority == 3:
+            return 'outbid'     # a competitor won a top priority of this bidder
+        if self.replan_every > 0 and self.cur_item_id + 1 - self.plan_item_id >= self.replan_every:
+            return f'{self.replan_every} items since the last plan'
+        return ''
+
     def get_replan_instruct(self):
         instruct = INSTRUCT_REPLAN_TEMPLATE.format(
             status_quo=self._status_json_to_text(self.status_quo),
@@ -542,6 +757,9 @@ class Bidder(BaseModel):
         return instruct
 
     def replan(self, instruct_replan: str):
+        return asyncio.run(self.areplan(instruct_replan))
+
+    async def areplan(self, instruct_replan: str):
         '''
         plan = replan(system_message, instruct_plan, prev_plan, status_quo + (learning) + instruct_replan)
         '''
@@ -556,6 +774,17 @@ class Bidder(BaseModel):
             self.withdraw = False
             return 'Skip replanning for bidders with static or no plan.'
         
+        if self.spectator or self.replan_trigger() == '':
+            if self.spectator:
+                self.skipped_llm_call_cnt += 1
+            else:
+                self.replan_skip_cnt += 1
+            self._keep_plan()
+            return 'Skip replanning: nothing calls for a new plan.'
+        # keep the current plan if it fails
+        return await self._awith_deadline('replan', self._areplan(instruct_replan), self._keep_plan)
+
+    async def _areplan(self, instruct_replan: str):
         replan_msg = HumanMessage(content=instruct_replan)
         
         messages = [SystemMessage(content=self.system_message),
@@ -563,9 +792,9 @@ class Bidder(BaseModel):
                     AIMessage(content=self.cur_plan)]
         messages.append(replan_msg)
 
-        result = self._run_llm_standalone(messages)
+        result = await self._arun_llm_best_of(messages, 'replan', lambda text: len(self._extract_json(text, track=False)) > 0)
         
-        new_plan_dict = extract_jsons_from_text(result)[-1]
+        new_plan_dict = self._extract_json(result)
         cnt = 0
         while len(new_plan_dict) == 0 and cnt < 2:
             err_msg = 'Your response does not contain a JSON-format priority list for items. Please revise your plan.'
@@ -573,8 +802,8 @@ class Bidder(BaseModel):
                 AIMessage(content=result),
                 HumanMessage(content=err_msg),
             ]
-            result = self._run_llm_standalone(messages)
-            new_plan_dict = extract_jsons_from_text(result)[-1]
+            result = await self._arun_llm_standalone(messages)
+            new_plan_dict = self._extract_json(result)
             
             self.dialogue_history += [
                 HumanMessage(content=err_msg),
@@ -594,6 +823,9 @@ class Bidder(BaseModel):
         self.withdraw = False
         self.bid_history = []  # clear bid history
         self.cur_item_id += 1
+        self.plan_item_id = self.cur_item_id
+        self.plan_budget = self.budget
+        self.plan_kept = False
 
         self.dialogue_history += [
             replan_msg,
@@ -612,6 +844,154 @@ class Bidder(BaseModel):
             print(f"Replan: {self.name} ({self.model_name}).")
         return result
     
+    def _keep_plan(self):
+        '''
+        Carry the current plan forward to the next item.
+        '''
+        self.changes_of_plan.append([
+            f"{self.cur_item_id + 1} ({self._get_cur_item('name')}, kept)", 
+            False, 
+            json.dumps(extract_jsons_from_text(self.cur_plan)[-1])
+        ])
+        self.bid_history = []  # clear bid history
+        self.cur_item_id += 1
+        self.withdraw = False
+        self.plan_kept = True
+        return self.cur_plan
+    
+    def summarize_replan(self, instruct_summarize: str):
+        return asyncio.run(self.asummarize_replan(instruct_summarize))
+
+    async def asummarize_replan(self, instruct_summarize: str):
+        '''
+        Fused `summarize` and `replan` of adaptive planners, one LLM call for both the status and the priorities.
+        status_quo, plan = summarize_replan(system_message, instruct_plan, prev_plan, instruct_summarize + instruct_replan)
+        '''
+        if not self.fused_replan or self.plan_strategy != 'adaptive' or self.oracle_status \
+                or 'rule' in self.model_name or 'human' in self.model_name or self.spectator or self.replan_trigger() == '':
+            await self.asummarize(instruct_summarize)
+            return await self.areplan(self.get_replan_instruct())
+        
+        self.budget_history.append(self.budget)
+        self.profit_history.append(self.profit)
+        # keep the previous status quo and the current plan if it fails
+        return await self._awith_deadline('summarize_replan', self._asummarize_replan(instruct_summarize), self._keep_plan)
+
+    async def _asummarize_replan(self, instruct_summarize: str):
+        instruct = INSTRUCT_SUMMARIZE_REPLAN_TEMPLATE.format(
+            summarize_instruct=instruct_summarize,
+            remaining_items_info=self._get_items_value_str(self._get_remaining_items()),
+            bidder_name=self.name,
+            desire_desc=DESIRE_DESC[self.desire],
+            learning_statement='' if not self.enable_learning else _LEARNING_STATEMENT
+        )
+        instruct_msg = HumanMessage(content=instruct)
+        messages = [SystemMessage(content=self.system_message),
+                    HumanMessage(content=self.plan_instruct),
+                    AIMessage(content=self.cur_plan),
+                    instruct_msg]
+        
+        def valid(text):
+            status_json, plan_dict = self._split_status_and_plan(text, track=False)
+            sanity_msg, consistency_msg = self._check_status(status_json, track=False)
+            return sanity_msg == '' and (consistency_msg == '' or not self.correct_belief) and len(plan_dict) > 0
+        
+        result = await self._arun_llm_best_of(messages, 'summarize_replan', valid)
+        self.dialogue_history += [instruct_msg, AIMessage(content=result)]
+        self.llm_prompt_history.append({
+            'messages': [{x.type: x.content} for x in messages],
+            'result': result,
+            'tag': f'summarize_replan_{self.cur_item_id}'
+        })
+        
+        status_json, new_plan_dict = self._split_status_and_plan(result)
+        cnt = 0
+        while cnt <= 3:
+            sanity_msg, consistency_msg = self._check_status(status_json)
+            plan_msg = '' if len(new_plan_dict) > 0 else '- Your response does not contain a JSON-format priority list for items.'
+            if sanity_msg != '' or (consistency_msg != '' and self.correct_belief) or plan_msg != '':
+                err_msg = f"As {self.name}, here are some error(s) of your status JSON and priority JSON:\n{sanity_msg.strip()}\n{consistency_msg.strip()}\n{plan_msg}\n\nPlease revise the status JSON based on the errors. Don't apologize. Just give me the revised status JSON first and the priority JSON last.".strip()
+                messages += [AIMessage(content=result), 
+                             HumanMessage(content=err_msg)]
+                result = await self._arun_llm_standalone(messages)
+                self.dialogue_history += [
+                    HumanMessage(content=err_msg),
+                    AIMessage(content=result),
+                ]
+                # keep the part that was not revised
+                revised_status, revised_plan = self._split_status_and_plan(result)
+                status_json = revised_status if len(revised_status) > 0 else status_json
+                new_plan_dict = revised_plan if len(revised_plan) > 0 else new_plan_dict
+                cnt += 1
+            else:
+                break
+        
+        self.status_quo = status_json
+        
+        old_plan_dict = extract_jsons_from_text(self.cur_plan)[-1]
+        self.changes_of_plan.append([
+            f"{self.cur_item_id + 1} ({self._get_cur_item('name')})", 
+            self._change_of_plan(old_plan_dict, new_plan_dict),
+            json.dumps(new_plan_dict)
+        ])
+        
+        self.plan_instruct = instruct
+        self.cur_plan = result
+        if extract_jsons_from_text(result)[-1] != new_plan_dict:
+            # the priorities came in an earlier response than the last revision
+            self.cur_plan += f"\n\nPriorities: {json.dumps(new_plan_dict)}"
+        self.withdraw = False
+        self.bid_history = []  # clear bid history
+        self.cur_item_id += 1
+        self.plan_item_id = self.cur_item_id
+        self.plan_budget = self.budget
+        self.plan_kept = False
+        
+        if self.verbose:
+            print(get_colored_text(instruct, 'blue'))
+            print(get_colored_text(result, 'green'))
+
+            print(f"Summarize and replan: {self.name} ({self.model_name}).")
+        return result
+    
+    def summarize_replan_bid(self, instruct_summarize: str, auctioneer_msg: str, withdraw: bool = False):
+        return asyncio.run(self.asummarize_replan_bid(instruct_summarize, auctioneer_msg, withdraw))
+
+    async def asummarize_replan_bid(self, instruct_summarize: str, auctioneer_msg: str, withdraw: bool = False):
+        '''
+        The pipeline of this bidder between two items: summarize the last item, replan and make
+        the first bid on the next one (`auctioneer_msg`), without waiting for the other bidders.
+        :param withdraw: withdraw without the LLM, as no valid bid is affordable
+        '''
+        await self.asummarize_replan(instruct_summarize)
+        self.need_input = True
+        bid_instruct = self.get_bid_instruct(auctioneer_msg, 0)
+        if withdraw:
+            return self.withdraw_without_llm(bid_instruct)
+        return await self.abid(bid_instruct)
+    
+    def _split_status_and_plan(self, text: str, track: bool = True):
+        '''
+        The status JSON and the priority JSON of a fused response, {} for a missing one.
+        '''
+        status_json, plan_dict = {}, {}
+        for data in extract_jsons_from_text(text):
+            if any(key in data for key in ['remaining_budget', 'total_profits', 'winning_bids']):
+                status_json = data
+            elif len(data) > 0:
+                plan_dict = data
+        if self._sanity_check_status_json(status_json) != '':
+            # a malformed status, repaired locally if possible
+            repaired = self._extract_json(text, self._sanity_check_status_json, track)
+            if self._sanity_check_status_json(repaired) == '':
+                status_json = repaired
+        if len(plan_dict) == 0:
+            # flat, so it starts at the last brace even behind an unclosed status
+            last_json = extract_jsons_from_text(text[text.rfind('{'):])[-1]
+            if not any(key in last_json for key in ['remaining_budget', 'total_profits', 'winning_bids']):
+                plan_dict = last_json
+        return status_json, plan_dict
+    
     def _change_of_plan(self, old_plan: dict, new_plan: dict):
         for k in new_plan:
             if new_plan[k] != old_plan.get(k, None):
@@ -637,10 +1017,35 @@ class Bidder(BaseModel):
         return msg
 
     def rebid_for_failure(self, fail_instruct: str):
-        result = self.bid(fail_instruct)
+        return asyncio.run(self.arebid_for_failure(fail_instruct))
+
+    async def arebid_for_failure(self, fail_instruct: str):
+        result = await self.abid(fail_instruct)
         self.failed_bid_cnt += 1
         return result
     
+    def _extract_json(self, text: str, sanity_check=None, track: bool = True):
+        '''
+        The last JSON object of `text` ({} if none), repaired locally if it does not parse or pass
+        `sanity_check`, which returns '' for a valid object (by default, any non-empty object).
+        Repairs are counted and printed unless not `track`.
+        '''
+        if sanity_check is None:
+            sanity_check = lambda data: '' if len(data) > 0 else 'Error: No parsible JSON.'
+        data = extract_jsons_from_text(text)[-1]
+        if sanity_check(data) == '':
+            return data
+        
+        repaired, fixes = repair_json(text, accept=lambda data: sanity_check(data) == '')
+        if len(fixes) > 0 and track:
+            self.json_repair_cnt += 1
+        if repaired is None or sanity_check(repaired) != '':
+            return data
+        if len(fixes) > 0 and track:
+            self.json_repaired_cnt += 1
+            print(f"* {self.name} repaired JSON: {', '.join(fixes)}")
+        return repaired
+
     def _sanity_check_status_json(self, data: dict):
         if data == {}:
             return "Error: No parsible JSON in your response. Possibly due to missing a closing curly bracket '}', or unpasible values (e.g., 'profit': 1000 + 400, instead of 'profit': 1400)."
@@ -700,23 +1105,26 @@ class Bidder(BaseModel):
         
         return structured_text.strip()
 
-    def _belief_tracking(self, status_text: str):
+    def _belief_tracking(self, belief_json: dict, track: bool = True):
         '''
-        Parse status quo and check if the belief is correct.
+        Check if the belief in the parsed status quo is correct.
+        :param track: count the checks and errors in the metrics, False for a dry run
         '''
-        belief_json = extract_jsons_from_text(status_text)[-1]
         # {"remaining_budget": 8000, "total_profits": {"Bidder 1": 1300, "Bidder 2": 1800, "Bidder 3": 0}, "winning_bids": {"Bidder 1": {"Item 2": 1200, "Item 3": 1000}, "Bidder 2": {"Item 1": 2000}, "Bidder 3": {}}}
         budget_belief = belief_json['remaining_budget']
         profits_belief = belief_json['total_profits']
         winning_bids = belief_json['winning_bids']
 
         msg = ''
+        total_cnt = {'self': 0, 'other': 0}
+        error_cnt = {'self': 0, 'other': 0}
+        budget_errors, profit_errors, win_bid_errors = [], [], []
         # track belief of budget
-        self.total_self_belief_cnt += 1
+        total_cnt['self'] += 1
         if budget_belief != self.budget:
             msg += f'- Your belief of budget is wrong: you have ${self.budget} left, but you think you have ${budget_belief} left.\n'
-            self.self_belief_error_cnt += 1
-            self.budget_error_history.append([
+            error_cnt['self'] += 1
+            budget_errors.append([
                 self._get_cur_item('name'),
                 budget_belief,
                 self.budget,
@@ -730,22 +1138,22 @@ class Bidder(BaseModel):
             
             if self.name in bidder_name: 
                 bidder_name = self.name
-                self.total_self_belief_cnt += 1
+                total_cnt['self'] += 1
             else:
-                self.total_other_belief_cnt += 1
+                total_cnt['other'] += 1
             
             real_profit = self.all_bidders_status[bidder_name]['profit']
             
             if profit != real_profit:
                 if self.name == bidder_name:
-                    self.self_belief_error_cnt += 1
+                    error_cnt['self'] += 1
                 else:
-                    self.other_belief_error_cnt += 1
+                    error_cnt['other'] += 1
 
                 msg += f'- Your belief of total profit of {bidder_name} is wrong: {bidder_name} has earned ${real_profit} so far, but you think {bidder_name} has earned ${profit}.\n'
 
                 # add to history
-                self.profit_error_history.append([
+                profit_errors.append([
                     f"{bidder_name} ({self._get_cur_item('name')})",
                     profit,
                     real_profit
@@ -764,26 +1172,34 @@ class Bidder(BaseModel):
             real_items_won_list = [str(x) for x, _ in real_items_won]
             
             if self.name in bidder_name:
-                self.total_self_belief_cnt += 1
+                total_cnt['self'] += 1
             else:
-                self.total_other_belief_cnt += 1
+                total_cnt['other'] += 1
             
             if not item_list_equal(items_won_list, real_items_won_list):
                 if bidder_name == self.name:
-                    self.self_belief_error_cnt += 1
+                    error_cnt['self'] += 1
                     _bidder_name = f'you'
                 else:
-                    self.other_belief_error_cnt += 1
+                    error_cnt['other'] += 1
                     _bidder_name = bidder_name
                 
                 msg += f"- Your belief of winning items of {bidder_name} is wrong: {bidder_name} won {real_items_won}, but you think {bidder_name} won {items_won_dict}.\n"
 
-                self.win_bid_error_history.append([
+                win_bid_errors.append([
                     f"{_bidder_name} ({self._get_cur_item('name')})",
                     ', '.join(items_won_list),
                     ', '.join(real_items_won_list)
                 ])
         
+        if track:
+            self.total_self_belief_cnt += total_cnt['self']
+            self.total_other_belief_cnt += total_cnt['other']
+            self.self_belief_error_cnt += error_cnt['self']
+            self.other_belief_error_cnt += error_cnt['other']
+            self.budget_error_history += budget_errors
+            self.profit_error_history += profit_errors
+            self.win_bid_error_history += win_bid_errors
         return msg
     
     def win_bid(self, item: Item, bid: int):
@@ -854,6 +1270,15 @@ class Bidder(BaseModel):
         budget_error_history = self.budget_error_history if self.budget_error_history != [] or as_json else [['', '']]
         changes_of_plan = self.changes_of_plan if self.changes_of_plan != [] or as_json else [['', '', '']]
         
+        # beliefs are not tracked with an oracle status quo
+        if self.oracle_status:
+            self_belief_error_cnt = other_belief_error_cnt = self_error_rate = other_error_rate = None
+        else:
+            self_belief_error_cnt = self.self_belief_error_cnt
+            other_belief_error_cnt = self.other_belief_error_cnt
+            self_error_rate = round(self.self_belief_error_cnt / (self.total_self_belief_cnt+1e-8), 2)
+            other_error_rate = round(self.other_belief_error_cnt / (self.total_other_belief_cnt+1e-8), 2)
+        
         if as_json:
             return {
                 'auction_hash': self.auction_hash,
@@ -871,14 +1296,22 @@ class Bidder(BaseModel):
                 'items_won': items_won,
                 'tokens_used': self.llm_token_count,
                 'openai_cost': round(self.openai_cost, 2),
+                'oracle_status': self.oracle_status,
                 'failed_bid_cnt': self.failed_bid_cnt,
-                'self_belief_error_cnt': self.self_belief_error_cnt,
-                'other_belief_error_cnt': self.other_belief_error_cnt,
+                'self_belief_error_cnt': self_belief_error_cnt,
+                'other_belief_error_cnt': other_belief_error_cnt,
                 'failed_bid_rate': round(self.failed_bid_cnt / (self.total_bid_cnt+1e-8), 2),
-                'self_error_rate': round(self.self_belief_error_cnt / (self.total_self_belief_cnt+1e-8), 2),
-                'other_error_rate': round(self.other_belief_error_cnt / (self.total_other_belief_cnt+1e-8), 2),
+                'self_error_rate': self_error_rate,
+                'other_error_rate': other_error_rate,
                 'engagement_count': self.engagement_count,
+                'json_repair_cnt': self.json_repair_cnt,
+                'json_repair_rate': round(self.json_repaired_cnt / (self.json_repair_cnt+1e-8), 2),
+                'replan_skip_cnt': self.replan_skip_cnt,
+                'skipped_llm_call_cnt': self.skipped_llm_call_cnt,
+                'fallbacks': self.fallback_history,
                 'engagement_history': self.engagement_history,
+                'hedge_cnt': self.hedger.hedges if self.hedger else 0,
+                'hedge_win_rate': self.hedger.win_rate() if self.hedger else 0,
                 'changes_of_plan': changes_of_plan,
                 'budget_error_history': budget_error_history,
                 'profit_error_history': profit_error_history,
@@ -893,14 +1326,16 @@ class Bidder(BaseModel):
                 self.llm_token_count, 
                 round(self.openai_cost, 2), 
                 round(self.failed_bid_cnt / (self.total_bid_cnt+1e-8), 2), 
-                round(self.self_belief_error_cnt / (self.total_self_belief_cnt+1e-8), 2), 
-                round(self.other_belief_error_cnt / (self.total_other_belief_cnt+1e-8), 2), 
+                self_error_rate, 
+                other_error_rate, 
                 self.engagement_count,
                 draw_plot(f"{self.name} ({self.model_name})", self.budget_history, self.profit_history), 
                 changes_of_plan,
                 budget_error_history,
                 profit_error_history, 
-                win_bid_error_history
+                win_bid_error_history,
+                self.hedger.hedges if self.hedger else 0,
+                self.hedger.win_rate() if self.hedger else 0,
             ]
 
     def dialogue_to_chatbot(self):
@@ -958,11 +1393,13 @@ def bidding_multithread(bidder_list: List[Bidder],
                         instruction_list, 
                         func_type,
                         thread_num=5,
-                        retry=1):
+                        retry=1,
+                        timeout=600):
     '''
     auctioneer_msg: either a uniform message (str) or customed (list)
+    timeout: seconds to wait for all bidders, after which the unfinished ones are reported as errors
     '''
-    assert func_type in ['plan', 'bid', 'summarize', 'replan']
+    assert func_type in ['plan', 'bid', 'summarize', 'replan', 'summarize_replan', 'summarize_replan_bid']
     
     result_queue = queue.Queue()
     threads = []
@@ -980,11 +1417,16 @@ def bidding_multithread(bidder_list: List[Bidder],
                 result = bidder.init_plan(auctioneer_msg)
             elif func_type == 'replan':
                 result = bidder.replan(auctioneer_msg)
+            elif func_type == 'summarize_replan':
+                result = bidder.summarize_replan(auctioneer_msg)
+            elif func_type == 'summarize_replan_bid':
+                result = bidder.summarize_replan_bid(*auctioneer_msg)
             else:
                 raise NotImplementedError(f'func_type {func_type} not implemented')
             result_queue.put((True, i, result))
-        # except Exception as e:
-        #     result_queue.put((False, i, str(trace_back(e))))
+        except Exception as e:
+            # a worker always posts, so that no result is waited for in vain
+            result_queue.put((False, i, str(trace_back(e))))
         finally:
             semaphore.release()
 
@@ -992,19 +1434,25 @@ def bidding_multithread(bidder_list: List[Bidder],
         instruction_list = [instruction_list] * len(bidder_list)
     
     for i, (bidder, msg) in enumerate(zip(bidder_list, instruction_list)):
-        thread = threading.Thread(target=run_once, args=(i, bidder, msg))
+        # daemon, so that an unfinished one never blocks the exit
+        thread = threading.Thread(target=run_once, args=(i, bidder, msg), daemon=True)
         thread.start()
         threads.append(thread)
     
+    deadline = time.time() + timeout
     for thread in threads:
-        thread.join(timeout=600)
+        thread.join(timeout=max(0, deadline - time.time()))
     
-    results = [result_queue.get() for _ in range(len(bidder_list))]
+    results = []
+    while not result_queue.empty():
+        results.append(result_queue.get_nowait())
     
     errors = []
     for success, id, result in results:
         if not success:
             errors.append((id, result))
+    finished = set(id for _, id, _ in results)
+    errors += [(i, f'not finished within {timeout} sec') for i in range(len(bidder_list)) if i not in finished]
     
     if errors:
         raise Exception(f"Error(s) in {func_type}:\n" + '\n'.join([f'{i}: {e}' for i, e in errors]))
@@ -1013,7 +1461,52 @@ def bidding_multithread(bidder_list: List[Bidder],
     valid_results.sort()
     
     return [x for _, x in valid_results]
-    
+
+
+async def bidding_async(bidder_list: List[Bidder],
+                        instruction_list,
+                        func_type,
+                        thread_num=None):
+    '''
+    Asyncio counterpart of `bidding_multithread`: every bidder runs on the current event loop.
+    In-flight LLM calls are paced per provider by the call layer; `thread_num` optionally caps
+    how many bidders run at a time on top of that.
+    '''
+    assert func_type in ['plan', 'bid', 'summarize', 'replan', 'summarize_replan', 'summarize_replan_bid']
+
+    semaphore = asyncio.Semaphore(int(thread_num)) if thread_num else contextlib.nullcontext()
+
+    async def run_once(bidder: Bidder, auctioneer_msg: str):
+        async with semaphore:
+            if func_type == 'bid':
+                return await bidder.abid(auctioneer_msg)
+            elif func_type == 'summarize':
+                return await bidder.asummarize(auctioneer_msg)
+            elif func_type == 'plan':
+                return await bidder.ainit_plan(auctioneer_msg)
+            elif func_type == 'replan':
+                return await bidder.areplan(auctioneer_msg)
+            elif func_type == 'summarize_replan':
+                return await bidder.asummarize_replan(auctioneer_msg)
+            elif func_type == 'summarize_replan_bid':
+                return await bidder.asummarize_replan_bid(*auctioneer_msg)
+            else:
+                raise NotImplementedError(f'func_type {func_type} not implemented')
+
+    if isinstance(instruction_list, str):
+        instruction_list = [instruction_list] * len(bidder_list)
+
+    results = await asyncio.gather(
+        *[run_once(bidder, msg) for bidder, msg in zip(bidder_list, instruction_list)],
+        return_exceptions=True)
+
+    errors = [(i, ''.join(traceback.format_exception(type(e), e, e.__traceback__)))
+              for i, e in enumerate(results) if isinstance(e, BaseException)]
+    if errors:
+        raise Exception(f"Error(s) in {func_type}:\n" + '\n'.join([f'{i}: {e}' for i, e in errors]))
+
+    return list(results)
+
 
 def bidders_to_chatbots(bidder_list: List[Bidder], profit_report=False):
     if profit_report:   # usually at the end of an auction
@@ -1022,10 +1515,14 @@ def bidders_to_chatbots(bidder_list: List[Bidder], profit_report=False):
         return [x.dialogue_to_chatbot() for x in bidder_list]
 
 
-def create_bidders(bidder_info_jsl, auction_hash):
+def create_bidders(bidder_info_jsl, auction_hash, **overrides):
+    '''
+    :param overrides: bidder settings applied to every bidder, e.g., api_base or stream_bid. None values are skipped.
+    '''
     bidder_info_jsl = LoadJsonL(bidder_info_jsl)
     bidder_list = []
     for info in bidder_info_jsl:
         info['auction_hash'] = auction_hash
+        info.update({k: v for k, v in overrides.items() if v is not None})
         bidder_list.append(Bidder.create(**info))
     return bidder_list
\ No newline at end of file
@@ -0,0 +1,55 @@
+'''
+Deadlines of bidder phases and of whole auctions.
+
+A phase (bid, summarize, replan, ...) that misses its deadline or whose LLM call fails for good
+is cut short, and the bidder takes a default action instead: a withdrawal for a bid, the
+previous status quo for a summary, the current plan for a replan. Once the auction deadline
+has passed, every phase falls back at once, so the auction runs out without more LLM calls.
+Per-call timeouts are set on the `RetryController`, which retries them like other timeouts.
+Errors of our own code are raised as usual.
+'''
+import asyncio
+import time
+from .llm_retry import is_llm_error
+
+
+class Deadlines():
+    '''
+    :param phase_timeout: seconds for one phase of a bidder, retries and revisions included (None for no limit)
+    :param auction_timeout: seconds for the whole auction, from `start()` when it begins (None for no limit)
+    '''
+    def __init__(self, phase_timeout: float = None, auction_timeout: float = None):
+        self.phase_timeout = phase_timeout
+        self.auction_timeout = auction_timeout
+        self.started = None     # the auction deadline only counts once started
+
+    def start(self):
+        self.started = time.time()
+
+    def time_left(self):
+        '''
+        Seconds left for the next phase, None for no limit.
+        '''
+        limits = []
+        if self.phase_timeout is not None:
+            limits.append(self.phase_timeout)
+        if self.auction_timeout is not None and self.started is not None:
+            limits.append(max(0., self.started + self.auction_timeout - time.time()))
+        return min(limits) if limits else None
+
+    def expired(self):
+        return self.auction_timeout is not None and self.started is not None and time.time() >= self.started + self.auction_timeout
+
+    async def arun(self, coro):
+        '''
+        Await `coro` within the time left.
+        :return: (result, None), or (None, why) if it timed out or its LLM calls failed. Other errors are raised.
+        '''
+        try:
+            return await asyncio.wait_for(coro, self.time_left()), None
+        except asyncio.TimeoutError:
+            return None, 'auction deadline' if self.expired() else 'phase deadline'
+        except Exception as e:
+            if not is_llm_error(e):
+                raise
+            return None, f'{type(e).__name__}: {e}'
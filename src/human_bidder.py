@@ -7,6 +7,7 @@ from langchain.schema import (
 from .bidder_base import Bidder, draw_plot
 from .item_base import Item
 from langchain.input import get_colored_text
+import asyncio
 import time
 
 
@@ -59,6 +60,9 @@ class HumanBidder(Bidder):
             AIMessage(content='(Getting ready...)')
         ]
         return ''
+
+    async def ainit_plan(self, plan_instruct: str):
+        return self.init_plan(plan_instruct)
     
     def get_bid_instruct(self, auctioneer_msg, bid_round):
         self.dialogue_history += [
@@ -79,6 +83,12 @@ class HumanBidder(Bidder):
         self.semaphore -= 1
         self.need_input = False
         return self.input_box
+
+    async def abid(self, bid_instruct, phase: str = 'bid'):
+        # wait for the cue without blocking the event loop. `phase` only matters to LLM bidders
+        while self.semaphore <= 0:
+            await asyncio.sleep(1)
+        return self.bid(bid_instruct)
     
     def get_summarize_instruct(self, bidding_history: str, hammer_msg: str, win_lose_msg: str):
         instruct_summarize = f"{bidding_history}\n\n{hammer_msg}\n{win_lose_msg}"
@@ -92,6 +102,9 @@ class HumanBidder(Bidder):
         self.budget_history.append(self.budget)
         self.profit_history.append(self.profit)
         return ''
+
+    async def asummarize(self, instruct_summarize: str):
+        return self.summarize(instruct_summarize)
     
     def get_replan_instruct(self):
         return ''
@@ -100,6 +113,9 @@ class HumanBidder(Bidder):
         self.withdraw = False
         self.cur_item_id += 1
         return ''
+
+    async def areplan(self, instruct_replan):
+        return self.replan(instruct_replan)
     
     def to_monitors(self, as_json=False):
         items_won = []
@@ -132,6 +148,8 @@ class HumanBidder(Bidder):
                 [],
                 [],
                 [], 
-                []
+                [],
+                0,
+                0,
             ]
     
\ No newline at end of file
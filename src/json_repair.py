@@ -0,0 +1,188 @@
+'''
+Local repair of almost-JSON in LLM responses.
+
+Status and plan JSONs often fail to parse for small reasons: code fences, single quotes,
+Python literals, trailing commas, dollar amounts, arithmetic (`1000 + 400`) or a missing
+closing brace. `repair_json` fixes these deterministically, so that only responses it cannot
+repair cost another LLM round trip. Fixes leave the contents of string values alone.
+'''
+import ast
+import operator
+import re
+import ujson as json
+
+
+FENCE = re.compile(r'```(?:json|JSON)?\s*\n?(.*?)(?:```|$)', re.DOTALL)
+SMART_QUOTES = re.compile(r'[“”„]')
+SINGLE_QUOTE_START = re.compile(r"[{\[,:]\s?$")
+SINGLE_QUOTE_END = re.compile(r"'(?=\s*[:,}\]])")
+PYTHON_LITERALS = re.compile(r'(?<=[:\[,\s])(True|False|None)(?=\s*[,}\]])')
+TRAILING_COMMA = re.compile(r',(\s*[}\]])')
+DOLLAR_AMOUNT = re.compile(r'(?<=[:\[,\s])\$\s?(\d[\d,]*(?:\.\d+)?)(?=\s*[,}\]\n])')
+THOUSANDS = re.compile(r'(?<=:\s)(\d{1,3}(?:,\d{3})+)(?=\s*[,}\]\n])|(?<=:)(\d{1,3}(?:,\d{3})+)(?=\s*[,}\]\n])')
+ARITHMETIC = re.compile(r'(?<=:)(\s*)(-?\s*\(?\s*\d+(?:\.\d+)?(?:\s*[-+*/]\s*\(?\s*-?\d+(?:\.\d+)?\s*\)?)+)(?=\s*[,}\]\n])')
+
+_OPERATORS = {ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv, ast.USub: operator.neg}
+
+
+def _evaluate(node):
+    # numbers and + - * / only
+    if isinstance(node, ast.Expression):
+        return _evaluate(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.left), _evaluate(node.right))
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.operand))
+    raise ValueError(f'Unsupported expression: {ast.dump(node)}')
+
+
+def _arithmetic(m: re.Match):
+    value = _evaluate(ast.parse(m.group(2), mode='eval'))
+    value = int(value) if float(value).is_integer() else round(value, 2)
+    return f'{m.group(1)}{value}'
+
+
+def _walk(text: str):
+    '''
+    Yield every (index, char, whether a string is open after the char).
+    '''
+    in_string = escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        yield i, char, in_string
+
+
+def _scan(text: str):
+    '''
+    :return: the end of the first balanced object (None if unbalanced), the closers of brackets left
+        open, and whether a string is left open
+    '''
+    stack = []
+    in_string = False
+    for i, char, in_string in _walk(text):
+        if in_string or char == '"':
+            continue
+        if char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if stack and stack[-1] == char:
+                stack.pop()
+            if not stack:
+                return i + 1, [], False
+    return None, stack, in_string
+
+
+def _outside_strings(pattern: re.Pattern, replace):
+    '''
+    A fix that applies `pattern.sub(replace, ...)` to matches outside string literals only.
+    '''
+    def fix(text: str):
+        quoted = [in_string for _, _, in_string in _walk(text)]
+        return pattern.sub(lambda m: m.group(0) if quoted[m.start()] else replace(m), text)
+    return fix
+
+
+def _double_quote(text: str):
+    # 'Bob's Item' ends at the quote before a colon, comma or closing bracket, not at the first one
+    out = []
+    i, in_string, escaped = 0, False, False
+    while i < len(text):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "'" and SINGLE_QUOTE_START.search(text, max(0, i - 2), i):
+            end = SINGLE_QUOTE_END.search(text, i + 1)
+            if end is not None and '\n' not in text[i+1:end.start()]:
+                out.append('"' + text[i+1:end.start()].replace('"', '\\"') + '"')
+                i = end.end()
+                continue
+        out.append(char)
+        i += 1
+    return ''.join(out)
+
+
+def _close_brackets(text: str):
+    end, stack, in_string = _scan(text)
+    if end is not None:
+        return text
+    text = text.rstrip().rstrip(',')
+    if in_string:
+        text += '"'
+    return text + ''.join(reversed(stack))
+
+
+# (name, fix), in order
+FIXES = [
+    ('smart quotes', lambda text: SMART_QUOTES.sub('"', text)),
+    ('single quotes', _double_quote),
+    ('python literals', _outside_strings(PYTHON_LITERALS, lambda m: {'True': 'true', 'False': 'false', 'None': 'null'}[m.group(1)])),
+    ('dollar amounts', _outside_strings(DOLLAR_AMOUNT, lambda m: m.group(1).replace(',', ''))),
+    ('thousands separators', _outside_strings(THOUSANDS, lambda m: (m.group(1) or m.group(2)).replace(',', ''))),
+    ('arithmetic', _outside_strings(ARITHMETIC, _arithmetic)),
+    ('unclosed brackets', _close_brackets),
+    ('trailing commas', _outside_strings(TRAILING_COMMA, lambda m: m.group(1))),
+]
+
+
+def _loads(text: str):
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def repair_json(text: str, accept=None):
+    '''
+    Parse the last JSON object of `text`, repairing it if needed. Fixes are applied one after
+    another until the object parses.
+    :param accept: optional check of a parsed object, e.g., of its keys. Objects that fail it are skipped.
+    :return: (the object or None, names of the fixes applied)
+    '''
+    fenced = FENCE.findall(text)
+    if fenced and '{' in fenced[-1]:
+        text = fenced[-1]
+    # try the top-level objects from the last one
+    candidates = []
+    start = text.find('{')
+    while start >= 0:
+        end, _, _ = _scan(text[start:])
+        if end is None:
+            candidates.append(text[start:])     # left open till the end
+            break
+        candidates.append(text[start:start+end])
+        start = text.find('{', start + end)
+    for candidate in reversed(candidates):
+        data = _loads(candidate)
+        fixes = []
+        for name, fix in FIXES:
+            if data is not None:
+                break
+            try:
+                fixed = fix(candidate)
+            except (ValueError, SyntaxError, ZeroDivisionError, RecursionError):
+                continue
+            if fixed != candidate:
+                candidate = fixed
+                fixes.append(name)
+                data = _loads(candidate)
+        if data is not None and (accept is None or accept(data)):
+            return data, (['code fences'] if fenced and fixes else []) + fixes
+    return None, []
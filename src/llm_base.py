@@ -0,0 +1,247 @@
+'''
+Awaitable LLM call layer shared by bidders and the auctioneer.
+'''
+import asyncio
+import time
+from typing import List, Pattern
+from langchain.base_language import BaseLanguageModel
+from langchain.callbacks import get_openai_callback
+from langchain.schema import BaseMessage
+from .llm_cache import LLMCache, make_cache_key, llm_signature
+from .llm_clients import use_session
+from .llm_hedge import Hedger, LatencyTracker
+from .llm_retry import RetryController
+from .rate_limiter import RateLimiter
+from .token_counter import count_tokens, estimate_cost
+
+
+_llm_cache: LLMCache = None
+_rate_limiter: RateLimiter = None
+_retry_controller: RetryController = RetryController()
+_latency_tracker: LatencyTracker = LatencyTracker()
+_single_flight: bool = True
+_in_flight = {}     # (event loop, request key) -> future of the response text
+_single_flight_stats = {'leaders': 0, 'coalesced': 0}
+
+
+def set_llm_cache(cache: LLMCache = None):
+    '''
+    Serve every LLM call through `cache` (None disables caching).
+    '''
+    global _llm_cache
+    _llm_cache = cache
+
+
+def get_llm_cache():
+    return _llm_cache
+
+
+def set_rate_limiter(limiter: RateLimiter = None):
+    '''
+    Reserve capacity from `limiter` before every LLM call (None disables rate limiting).
+    '''
+    global _rate_limiter
+    _rate_limiter = limiter
+
+
+def get_rate_limiter():
+    return _rate_limiter
+
+
+def set_retry_controller(controller: RetryController):
+    '''
+    Replace the retry policy and per-provider concurrency limits of every LLM call.
+    '''
+    global _retry_controller
+    _retry_controller = controller
+
+
+def get_retry_controller():
+    return _retry_controller
+
+
+def set_single_flight(enabled: bool = True):
+    '''
+    Coalesce identical deterministic requests in flight into one provider call.
+    '''
+    global _single_flight
+    _single_flight = enabled
+
+
+def get_single_flight_stats():
+    return dict(_single_flight_stats)
+
+
+def get_latency_tracker():
+    return _latency_tracker
+
+
+def _requested_tokens(llm: BaseLanguageModel, messages: List[BaseMessage], **kwargs):
+    # providers count the requested completion length against the token budget
+    max_output = kwargs.get('max_tokens') or kwargs.get('max_tokens_to_sample') or kwargs.get('max_output_tokens') or 0
+    return count_tokens(llm, messages) + max_output
+
+
+async def _astream_until(llm: BaseLanguageModel, messages: List[BaseMessage], stop_pattern: Pattern, **kwargs):
+    '''
+    Stream the response and hang up as soon as `stop_pattern` matches, e.g., at a bid decision.
+    '''
+    text = ''
+    stream = llm.astream(messages, **kwargs)
+    try:
+        async for chunk in stream:
+            # only the new tail can complete a match
+            start = max(0, len(text) - 64)
+            text += chunk.content
+            if stop_pattern.search(text, start):
+                break
+    finally:
+        await stream.aclose()
+    return text
+
+
+async def _ahedged(hedger: Hedger, latency_key, request, estimate_extra_cost, reserve_now):
+    '''
+    Await `request()`, and send a duplicate if it is slower than the hedger's latency percentile.
+    The first successful response wins and the other request is cancelled.
+    '''
+    delay = hedger.hedge_delay(_latency_tracker, latency_key)
+    if delay is None:
+        return await request()
+
+    first = asyncio.ensure_future(request())
+    done, _ = await asyncio.wait([first], timeout=delay)
+    extra_cost = 0 if done else estimate_extra_cost()
+    if done or not hedger.budget.try_spend(extra_cost):
+        return await first
+    if not reserve_now():
+        # no rate-limit headroom for a duplicate right now
+        hedger.budget.refund(extra_cost)
+        return await first
+
+    hedger.hedges += 1
+    second = asyncio.ensure_future(request())
+    pending = {first, second}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        hedger.wins += 1
+                    return task.result()
+        # both failed: raise the original error
+        return first.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def acall_llm(llm: BaseLanguageModel, messages: List[BaseMessage], stop_pattern: Pattern = None, hedger: Hedger = None,
+                    coalesce: bool = None, sample: int = 0, **kwargs):
+    '''
+    Send one chat request without blocking the event loop.
+    With `stop_pattern`, the response is streamed and cut right after the first match.
+    With `hedger`, a slow request gets a duplicate, within the hedger's budget.
+    Identical deterministic requests in flight are coalesced into one provider call. `coalesce`
+    defaults to whether the temperature is 0; pass False where independent samples matter.
+    `sample` > 0 marks another independent sample of the same request, cached apart.
+    Return the response text and the cost of the call (0 for a cache hit or a coalesced request).
+    '''
+    cache = _llm_cache
+    if coalesce is None:
+        coalesce = llm_signature(llm)['temperature'] == 0
+    coalesce = coalesce and _single_flight
+    if cache is not None or coalesce:
+        key_kwargs = kwargs if stop_pattern is None else {**kwargs, 'stop_pattern': stop_pattern.pattern}
+        if sample:
+            key_kwargs = {**key_kwargs, 'sample': sample}
+        key = make_cache_key(llm, messages, **key_kwargs)
+    if cache is not None:
+        cached = cache.lookup(key)
+        if cached is not None:
+            return cached, 0
+
+    if not coalesce:
+        text, cost = await _acall_provider(llm, messages, stop_pattern, hedger, **kwargs)
+    else:
+        flight_key = (asyncio.get_running_loop(), key)
+        while flight_key in _in_flight:
+            flight = _in_flight[flight_key]
+            try:
+                # shielded, so that a waiter giving up never cancels the shared request
+                text = await asyncio.shield(flight)
+                _single_flight_stats['coalesced'] += 1
+                return text, 0
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # the leading request was cancelled, try again
+
+        flight = asyncio.get_running_loop().create_future()
+        _in_flight[flight_key] = flight
+        _single_flight_stats['leaders'] += 1
+        try:
+            text, cost = await _acall_provider(llm, messages, stop_pattern, hedger, **kwargs)
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # retrieved here, waiters re-raise it
+            raise
+        else:
+            flight.set_result(text)
+        finally:
+            del _in_flight[flight_key]
+
+    if cache is not None:
+        cache.update(key, text)
+    return text, cost
+
+
+async def _acall_provider(llm: BaseLanguageModel, messages: List[BaseMessage], stop_pattern: Pattern = None, hedger: Hedger = None, **kwargs):
+    use_session(llm)
+    limiter = _rate_limiter
+    limit_key = None
+    if limiter is not None:
+        limit_key = limiter.get_limit(llm._llm_type, llm_signature(llm)['model'])
+
+    async def reserve():
+        if limit_key is not None:
+            await limiter.acquire(limit_key, _requested_tokens(llm, messages, **kwargs))
+
+    def reserve_now():
+        # a duplicate request never waits for rate-limit capacity
+        return limit_key is None or limiter.try_acquire(limit_key, _requested_tokens(llm, messages, **kwargs)) == 0
+
+    async def request():
+        if stop_pattern is not None:
+            return await _astream_until(llm, messages, stop_pattern, **kwargs)
+        result = await llm.agenerate([messages], **kwargs)
+        generation = result.generations[0][0]
+        # a forced function call comes back as its JSON arguments
+        message = getattr(generation, 'message', None)
+        function_call = None if message is None else message.additional_kwargs.get('function_call')
+        if function_call is not None and not generation.text:
+            return function_call.get('arguments', '')
+        return generation.text
+
+    latency_key = (llm._llm_type, llm_signature(llm)['model'], stop_pattern is not None)
+
+    async def call():
+        with get_openai_callback() as cb:
+            start = time.time()
+            if hedger is None:
+                text = await request()
+            else:
+                text = await _ahedged(hedger, latency_key, request, lambda: estimate_cost(llm, messages, ''), reserve_now)
+            _latency_tracker.record(latency_key, time.time() - start)
+            return text, cb.total_cost
+
+    text, cost = await _retry_controller.run(llm._llm_type, call, before_attempt=reserve)
+    if cost == 0:
+        # the callback only prices non-streamed OpenAI calls
+        cost = estimate_cost(llm, messages, text)
+    return text, cost
@@ -0,0 +1,142 @@
+'''
+Persistent, content-addressed cache of LLM responses.
+
+Responses are stored in a SQLite file keyed by a hash of the model, its sampling
+parameters and the normalized message list, so re-running an experiment does not
+pay again for prompts that have already been answered.
+'''
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+import ujson as json
+from langchain.schema import BaseMessage
+
+
+CACHE_MODES = ['readwrite', 'read_only', 'record_only']
+
+
+DEFAULT_API_BASES = [None, '', 'https://api.anthropic.com']
+
+
+def llm_signature(llm, **kwargs):
+    '''
+    Identify the model, endpoint and sampling parameters of a request.
+    '''
+    signature = {
+        'llm_type': llm._llm_type,
+        'model': getattr(llm, 'model_name', None) or getattr(llm, 'model', None),
+        'temperature': getattr(llm, 'temperature', None),
+        **kwargs,
+    }
+    # responses of another endpoint (e.g., a stub server) are not the provider's. Keys of the
+    # default endpoints stay as they were.
+    api_base = getattr(llm, 'openai_api_base', None) or getattr(llm, 'anthropic_api_url', None)
+    if api_base not in DEFAULT_API_BASES:
+        signature['api_base'] = api_base
+    return signature
+
+
+def normalize_messages(messages: List[BaseMessage]):
+    return [[msg.type, msg.content.strip()] for msg in messages]
+
+
+def make_cache_key(llm, messages: List[BaseMessage], **kwargs):
+    payload = json.dumps({
+        'llm': llm_signature(llm, **kwargs),
+        'messages': normalize_messages(messages),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMCache():
+    '''
+    :param path: SQLite file, shared safely by threads and local processes
+    :param mode: 'readwrite' (default), 'read_only' (never write), or 'record_only' (never serve hits)
+    :param max_size_mb: evict least recently used responses beyond this total size
+    :param max_age_days: evict responses older than this
+    '''
+    def __init__(self, path: str, mode: str = 'readwrite', max_size_mb: float = None, max_age_days: float = None):
+        assert mode in CACHE_MODES, f'cache mode should be one of {CACHE_MODES}'
+        self.path = path
+        self.mode = mode
+        self.max_size_mb = max_size_mb
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, response TEXT, size INTEGER, created REAL, accessed REAL)')
+        self.evict()
+
+    def lookup(self, key: str):
+        if self.mode == 'record_only':
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if self.mode != 'read_only':
+                with self._conn:
+                    self._conn.execute('UPDATE responses SET accessed = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def update(self, key: str, response: str):
+        if self.mode == 'read_only':
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, response, size, created, accessed) VALUES (?, ?, ?, ?, ?)',
+                (key, response, len(response.encode('utf-8')), now, now))
+            self.writes += 1
+        if self.writes % 100 == 0:
+            self.evict()
+
+    def evict(self):
+        if self.mode == 'read_only':
+            return
+        with self._lock, self._conn:
+            if self.max_age_days is not None:
+                self._conn.execute('DELETE FROM responses WHERE created < ?',
+                                   (time.time() - self.max_age_days * 86400,))
+            if self.max_size_mb is not None:
+                max_bytes = int(self.max_size_mb * 1024 * 1024)
+                total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                if total > max_bytes:
+                    # drop least recently used responses until the cache fits
+                    rows = self._conn.execute('SELECT key, size FROM responses ORDER BY accessed').fetchall()
+                    stale_keys = []
+                    for key, size in rows:
+                        if total <= max_bytes:
+                            break
+                        stale_keys.append((key,))
+                        total -= size
+                    self._conn.executemany('DELETE FROM responses WHERE key = ?', stale_keys)
+
+    def hit_rate(self):
+        return self.hits / (self.hits + self.misses + 1e-8)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'hits': self.hits,
+            'misses': self.misses,
+            'writes': self.writes,
+            'hit_rate': round(self.hit_rate(), 4),
+        }
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,130 @@
+'''
+Process-wide registry of LLM clients.
+
+Bidders and the auctioneer share one client per provider, model, settings and credentials
+instead of building their own for every auction and every bid parse. Shared clients keep
+their connections alive: Anthropic clients pool them in httpx, and OpenAI requests (openai<1
+opens a new aiohttp session per request by default) go through one pooled session per event
+loop, opened with `open_session`.
+
+Async Anthropic clients bind their httpx pool to the event loop that first used it, so they
+are shared per event loop: `get_chat_model` called inside a loop returns the client of that
+loop. Sync wrappers such as `Bidder.bid` run every call on a fresh loop with `asyncio.run`.
+'''
+import asyncio
+import atexit
+import hashlib
+import os
+import threading
+import aiohttp
+import httpx
+import openai
+from langchain.chat_models import ChatAnthropic, ChatOpenAI, ChatGooglePalm
+from .stub_llm import ChatStub
+
+
+POOL_SIZE = 64      # keep-alive connections per client, in line with the default max concurrency per provider
+
+_clients = {}
+_sessions = {}      # event loop -> aiohttp session of OpenAI requests
+_lock = threading.Lock()
+
+
+def _credential(env_var: str):
+    # tell clients of different keys apart without keeping the keys around
+    return hashlib.sha256(os.environ.get(env_var, '').encode('utf-8')).hexdigest()[:16]
+
+
+def _build_chat_model(model_name: str, temperature: float, api_base: str = None):
+    # a single attempt per request: retries are classified and paced by the call layer (llm_retry.py)
+    if 'gpt-' in model_name:
+        return ChatOpenAI(model=model_name, temperature=temperature, max_retries=1, request_timeout=1200, openai_api_base=api_base)
+    elif 'claude' in model_name:
+        llm = ChatAnthropic(model=model_name, temperature=temperature, default_request_timeout=1200, anthropic_api_url=api_base)
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=POOL_SIZE)
+        llm.client = llm.client.with_options(max_retries=0, connection_pool_limits=limits)
+        llm.async_client = llm.async_client.with_options(max_retries=0, connection_pool_limits=limits)
+        return llm
+    elif 'bison' in model_name:
+        return ChatGooglePalm(model_name=f'models/{model_name}', temperature=temperature)
+    elif 'stub' in model_name:
+        return ChatStub(model_name=model_name, temperature=temperature)
+    raise NotImplementedError(model_name)
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_chat_model(model_name: str, temperature: float = 0., api_base: str = None):
+    '''
+    The shared chat model of `model_name`, built on first use. Anthropic clients are shared
+    within the running event loop only.
+    '''
+    loop = None
+    if 'gpt-' in model_name:
+        credential = _credential('OPENAI_API_KEY')
+    elif 'claude' in model_name:
+        credential = _credential('ANTHROPIC_API_KEY')
+        loop = _running_loop()
+    else:
+        credential = None
+    key = (model_name, temperature, api_base, credential, loop)
+    with _lock:
+        # clients of closed loops cannot be used anymore
+        for stale_key in [k for k in _clients if k[-1] is not None and k[-1].is_closed()]:
+            del _clients[stale_key]
+        if key not in _clients:
+            _clients[key] = _build_chat_model(model_name, temperature, api_base)
+        return _clients[key]
+
+
+def open_session():
+    '''
+    Pool the OpenAI connections of the running event loop in one keep-alive session. Idempotent.
+    '''
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if loop not in _sessions or _sessions[loop].closed:
+            connector = aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=60)
+            _sessions[loop] = aiohttp.ClientSession(connector=connector)
+        return _sessions[loop]
+
+
+def get_session():
+    '''
+    The pooled session of the running event loop, or None if `open_session` was not called.
+    '''
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        return None
+    return session
+
+
+def use_session(llm):
+    '''
+    Route the OpenAI requests of the current task through the pooled session, if any.
+    '''
+    if llm._llm_type == 'openai-chat':
+        session = get_session()
+        if session is not None:
+            openai.aiosession.set(session)
+
+
+async def close_session():
+    with _lock:
+        session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None:
+        await session.close()
+
+
+@atexit.register
+def _close_sessions():
+    for loop, session in list(_sessions.items()):
+        if not loop.is_closed() and not loop.is_running() and not session.closed:
+            loop.run_until_complete(session.close())
+    _sessions.clear()
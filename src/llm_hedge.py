@@ -0,0 +1,94 @@
+'''
+Hedged LLM requests against slow outliers.
+
+A call that takes longer than a chosen percentile of recent latencies of its model gets a
+duplicate request, and whichever returns first wins while the other is cancelled. The
+duplicates of one auction draw from a shared `HedgeBudget`, which caps their number and
+estimated extra cost. Each caller (bidder) holds a `Hedger` that counts its hedges and wins.
+'''
+import threading
+from collections import defaultdict, deque
+
+
+class LatencyTracker():
+    '''
+    Latencies of recent calls, per model.
+    '''
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._latencies = defaultdict(lambda: deque(maxlen=self.window))
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds: float):
+        with self._lock:
+            self._latencies[key].append(seconds)
+
+    def percentile(self, key, p: float, min_samples: int = 20):
+        '''
+        The p-th percentile of recent latencies, or None with fewer than `min_samples` calls.
+        '''
+        with self._lock:
+            latencies = sorted(self._latencies[key])
+        if len(latencies) < min_samples:
+            return None
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+
+class HedgeBudget():
+    '''
+    Hedging policy and extra-cost cap shared by the bidders of one auction.
+
+    :param percentile: hedge a call once it is slower than this percentile of recent latencies
+    :param max_hedges: maximum number of duplicate requests, None for unlimited
+    :param max_cost: maximum estimated extra cost (USD) of duplicate requests, None for unlimited
+    :param min_delay: never hedge before this many seconds
+    :param min_samples: calls of a model to observe before hedging it
+    '''
+    def __init__(self, percentile: float = 95., max_hedges: int = None, max_cost: float = None,
+                 min_delay: float = 0., min_samples: int = 20):
+        self.percentile = percentile
+        self.max_hedges = max_hedges
+        self.max_cost = max_cost
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.hedges = 0
+        self.extra_cost = 0.
+        self._lock = threading.Lock()
+
+    def try_spend(self, cost: float = 0.):
+        '''
+        Reserve one duplicate request of estimated `cost`. Return False if the budget is used up.
+        '''
+        with self._lock:
+            if self.max_hedges is not None and self.hedges >= self.max_hedges:
+                return False
+            if self.max_cost is not None and self.extra_cost + cost > self.max_cost:
+                return False
+            self.hedges += 1
+            self.extra_cost += cost
+            return True
+
+    def refund(self, cost: float = 0.):
+        with self._lock:
+            self.hedges -= 1
+            self.extra_cost -= cost
+
+    def stats(self):
+        return {'hedges': self.hedges, 'extra_cost': round(self.extra_cost, 4)}
+
+
+class Hedger():
+    '''
+    Hedging of one caller, drawing from a shared budget.
+    '''
+    def __init__(self, budget: HedgeBudget):
+        self.budget = budget
+        self.hedges = 0
+        self.wins = 0   # hedges that returned before the original request
+
+    def hedge_delay(self, tracker: LatencyTracker, key):
+        delay = tracker.percentile(key, self.budget.percentile, self.budget.min_samples)
+        return None if delay is None else max(delay, self.budget.min_delay)
+
+    def win_rate(self):
+        return round(self.wins / (self.hedges + 1e-8), 2)
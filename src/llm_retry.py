@@ -0,0 +1,216 @@
+'''
+Classified retries and adaptive (AIMD) concurrency for LLM calls.
+
+Failures are sorted into rate-limit, timeout, server-error and bad-request errors.
+Only the first three are retried, with jittered exponential backoff that honors
+retry-after hints. Each provider gets its own in-flight limit that grows by one
+per window of successes and halves on a 429, so throughput converges to the
+provider's real capacity instead of a fixed thread count. Errors of our own code are
+raised at once.
+'''
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+
+
+RATE_LIMIT = 'rate_limit'
+TIMEOUT = 'timeout'
+SERVER_ERROR = 'server_error'
+BAD_REQUEST = 'bad_request'
+RETRYABLE_ERRORS = [RATE_LIMIT, TIMEOUT, SERVER_ERROR]
+
+
+def _status_code(error: Exception):
+    # openai<1 uses http_status, anthropic uses status_code
+    status = getattr(error, 'http_status', None) or getattr(error, 'status_code', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = getattr(error.response, 'status_code', None)
+    return status
+
+
+def classify_error(error: Exception):
+    name = type(error).__name__
+    status = _status_code(error)
+    if status == 429 or 'RateLimit' in name:
+        return RATE_LIMIT
+    elif isinstance(error, asyncio.TimeoutError) or 'Timeout' in name or status in [408, 504]:
+        return TIMEOUT
+    elif (status is not None and status >= 500) or name in ['APIError', 'ServiceUnavailableError', 'TryAgain', 'APIConnectionError', 'InternalServerError']:
+        return SERVER_ERROR
+    elif status is not None and 400 <= status < 500:
+        return BAD_REQUEST
+    elif name in ['InvalidRequestError', 'AuthenticationError', 'PermissionError', 'BadRequestError', 'NotImplementedError']:
+        return BAD_REQUEST
+    # other errors of the provider or its client (e.g., dropped connections) are worth another try
+    return SERVER_ERROR
+
+
+# packages of provider clients and their HTTP stacks
+LLM_ERROR_PACKAGES = ['openai', 'anthropic', 'httpx', 'httpcore', 'aiohttp', 'google', 'requests', 'urllib3']
+
+
+def is_llm_error(error: Exception):
+    '''
+    Whether `error` comes from a provider or its client, rather than from our own code.
+    '''
+    return _status_code(error) is not None or type(error).__module__.split('.')[0] in LLM_ERROR_PACKAGES
+
+
+def get_retry_after(error: Exception):
+    '''
+    Seconds the provider asked us to wait, if any.
+    '''
+    headers = getattr(error, 'headers', None)
+    if not headers and getattr(error, 'response', None) is not None:
+        headers = getattr(error.response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms') is not None:
+            return float(headers.get('retry-after-ms')) / 1000
+        if headers.get('retry-after') is not None:
+            return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+def backoff_delay(attempt: int, base_delay: float = 1., max_delay: float = 60.):
+    # full jitter: spread retries of concurrent callers apart
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt + 1)))
+
+
+def _wake(fut):
+    if not fut.done():
+        fut.set_result(True)
+
+
+class AdaptiveConcurrency():
+    '''
+    Additive-increase/multiplicative-decrease limit on in-flight requests of one provider.
+    Waiters from any thread or event loop are served in FIFO order.
+    '''
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 64, cooldown: float = 2.):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.cooldown = cooldown    # seconds between two decreases, so one burst of 429s halves only once
+        self.in_flight = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self._last_decrease = 0.
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self.in_flight += 1
+            fut.get_loop().call_soon_threadsafe(_wake, fut)
+
+    async def acquire(self):
+        with self._lock:
+            if self.in_flight < int(self.limit) and not self._waiters:
+                self.in_flight += 1
+                return
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+        try:
+            await fut   # the slot is handed over by release()
+        except asyncio.CancelledError:
+            with self._lock:
+                if fut in self._waiters:
+                    self._waiters.remove(fut)
+                else:
+                    self.in_flight -= 1
+                    self._wake_waiters()
+            raise
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._wake_waiters()
+
+    def on_success(self):
+        with self._lock:
+            self.successes += 1
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake_waiters()
+
+    def on_rate_limit(self):
+        with self._lock:
+            self.rate_limited += 1
+            now = time.time()
+            if now - self._last_decrease > self.cooldown:
+                self.limit = max(self.min_limit, self.limit / 2)
+                self._last_decrease = now
+
+    def stats(self):
+        return {
+            'limit': round(self.limit, 2),
+            'successes': self.successes,
+            'rate_limited': self.rate_limited,
+            'rate_limit_ratio': round(self.rate_limited / (self.successes + self.rate_limited + 1e-8), 4),
+        }
+
+
+class RetryController():
+    '''
+    Per-provider concurrency limits plus the retry policy shared by every LLM call.
+    '''
+    def __init__(self, max_attempts: int = 6, base_delay: float = 1., max_delay: float = 60.,
+                 initial_concurrency: int = 4, max_concurrency: int = 64, call_timeout: float = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.call_timeout = call_timeout    # seconds per attempt, a timeout error past it
+        self.providers = {}
+        self._lock = threading.Lock()
+
+    def get_concurrency(self, provider: str):
+        with self._lock:
+            if provider not in self.providers:
+                self.providers[provider] = AdaptiveConcurrency(
+                    initial=min(self.initial_concurrency, self.max_concurrency),
+                    max_limit=self.max_concurrency)
+            return self.providers[provider]
+
+    async def run(self, provider: str, call, before_attempt=None):
+        '''
+        Await `call()` under the provider's concurrency limit, retrying retryable failures.
+        `before_attempt()` is awaited before each attempt, e.g., to reserve rate-limit capacity.
+        '''
+        concurrency = self.get_concurrency(provider)
+        for attempt in range(self.max_attempts):
+            if before_attempt is not None:
+                await before_attempt()
+            await concurrency.acquire()
+            try:
+                result = await asyncio.wait_for(call(), self.call_timeout)
+            except Exception as e:
+                if not (is_llm_error(e) or isinstance(e, asyncio.TimeoutError)):
+                    raise   # a bug of ours, not worth another try
+                error_type = classify_error(e)
+                if error_type == RATE_LIMIT:
+                    concurrency.on_rate_limit()
+                if error_type not in RETRYABLE_ERRORS or attempt == self.max_attempts - 1:
+                    raise
+                delay = get_retry_after(e)
+                if delay is None:
+                    delay = backoff_delay(attempt, self.base_delay, self.max_delay)
+                print(f'Retrying {provider} after {error_type} ({attempt+1}/{self.max_attempts}), wait for {delay:.1f} sec: {e}')
+            else:
+                concurrency.on_success()
+                return result
+            finally:
+                concurrency.release()
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {provider: concurrency.stats() for provider, concurrency in self.providers.items()}
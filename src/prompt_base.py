@@ -42,6 +42,11 @@ Give your reasons first, then make your final decision clearly. You should eithe
 """.strip()
 
 
+STRUCTURED_BID_INSTRUCTION = """
+Answer with a JSON object of your decision and nothing else: {"rationale": "<your reasons>", "action": "bid" or "withdraw", "amount": <your bid in dollars as an integer, 0 if you withdraw>}
+""".strip()
+
+
 INSTRUCT_SUMMARIZE_TEMPLATE = """
 Here is the history of the bidding war of {cur_item}:
 "{bidding_history}"
@@ -101,6 +106,27 @@ As {bidder_name}, considering the current status{learning_statement}, review you
 """.strip()
 
 
+# summarize and replan in one go
+INSTRUCT_SUMMARIZE_REPLAN_TEMPLATE = """
+{summarize_instruct}
+
+---
+
+Here are the remaining items in the rest of the auction:
+"{remaining_items_info}"
+
+Then, as {bidder_name}, considering the updated status{learning_statement}, review your strategies. Adjust your plans based on the outcomes and new information to achieve your primary objective. Please do the following:
+1. Always remember: {desire_desc}.
+2. Determine and explain if there's a need to update the priority list of remaining items based on the updated status. 
+3. Present the updated priorities in a JSON format, each item should be represented as a key-value pair, where the key is the item name and the value is its priority on the scale from 1-3. An example output is: {{"Fixture Y": 3, "Module B": 2, "Product G": 2}}. The descriptions of the priority scale of items are as follows.
+    * 1 - This item is the least important. Consider giving it up if necessary to save money for the rest of the auction.
+    * 2 - This item holds value but isn't a top priority for the bidder. Could bid on it if you have enough budget.
+    * 3 - This item is of utmost importance and is a top priority for the bidder in the rest of the auction.
+
+Output the status JSON first and the priority JSON last, as two separate JSON objects.
+""".strip()
+
+
 # for auctioneer
 PARSE_BID_INSTRUCTION = """
 Your task is to parse a response from a bidder in an auction, and extract the bidding price from the response. Here are the rules:
@@ -114,6 +140,19 @@ Don't say anything else other than just a number: either the bidding price (e.g.
 """.strip()
 
 
+PARSE_BIDS_INSTRUCTION = """
+Your task is to parse {n} responses from bidders in an auction, and extract the bidding price from each response. Here are the rules:
+- If a bidder decides to withdraw from the bidding (e.g., saying "I'm out!"), output -1.
+- If a bidding price is mentioned (e.g., saying "I bid $xxx!"), output that price number (e.g., 1200 for $1,200).
+- If the bidding decision of a response is unclear, output null.
+Here are the responses:
+
+{responses}
+
+Don't say anything else other than a JSON array of {n} numbers, one for each response in the same order, e.g., [1200, -1, null].
+""".strip()
+
+
 AUCTION_HISTORY = """
 ## Auction Log
 
@@ -0,0 +1,102 @@
+'''
+Token-bucket rate limiter shared by threads and local processes.
+
+Each (provider, model) bucket lives in a small JSON file guarded by an exclusive
+file lock, so several `auction_workflow.py` processes on one machine draw from the
+same request-per-minute and token-per-minute budget without an external service.
+'''
+import asyncio
+import fcntl
+import os
+import re
+import tempfile
+import time
+import ujson as json
+
+
+DEFAULT_LOCK_DIR = os.path.join(tempfile.gettempdir(), 'auction_arena_rate_limits')
+
+
+class RateLimiter():
+    '''
+    :param limits: {model_or_provider_prefix: {'rpm': int, 'tpm': int}}, either budget can be None for unlimited.
+                   The longest matching prefix of the model name (or else the provider) applies.
+    :param lock_dir: directory of bucket files, shared by every process using the same quota
+    '''
+    def __init__(self, limits: dict, lock_dir: str = DEFAULT_LOCK_DIR):
+        self.limits = limits
+        self.lock_dir = lock_dir
+        self.wait_time = 0.
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def get_limit(self, provider: str, model: str):
+        matches = [k for k in self.limits if model and model.startswith(k)]
+        if matches:
+            return max(matches, key=len)
+        elif provider in self.limits:
+            return provider
+        return None
+
+    def _bucket_file(self, limit_key: str):
+        return os.path.join(self.lock_dir, re.sub(r'[^\w.-]', '_', limit_key) + '.json')
+
+    def try_acquire(self, limit_key: str, tokens: int = 0):
+        '''
+        Reserve one request and `tokens` tokens. Return 0 on success, otherwise the seconds to wait.
+        '''
+        rpm = self.limits[limit_key].get('rpm')
+        tpm = self.limits[limit_key].get('tpm')
+        if tpm is not None:
+            tokens = min(tokens, tpm)   # an oversized request must still pass eventually
+
+        with open(self._bucket_file(limit_key), 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                now = time.time()
+                f.seek(0)
+                raw = f.read()
+                state = json.loads(raw) if raw else {'requests': rpm, 'tokens': tpm, 'updated': now}
+                elapsed = max(now - state['updated'], 0)
+                if rpm is not None:
+                    state['requests'] = min(rpm, state['requests'] + elapsed * rpm / 60)
+                if tpm is not None:
+                    state['tokens'] = min(tpm, state['tokens'] + elapsed * tpm / 60)
+                state['updated'] = now
+
+                wait = 0.
+                if rpm is not None and state['requests'] < 1:
+                    wait = max(wait, (1 - state['requests']) * 60 / rpm)
+                if tpm is not None and state['tokens'] < tokens:
+                    wait = max(wait, (tokens - state['tokens']) * 60 / tpm)
+                if wait == 0:
+                    if rpm is not None:
+                        state['requests'] -= 1
+                    if tpm is not None:
+                        state['tokens'] -= tokens
+
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return wait
+
+    async def acquire(self, limit_key: str, tokens: int = 0):
+        while True:
+            wait = self.try_acquire(limit_key, tokens)
+            if wait == 0:
+                return
+            self.wait_time += wait
+            await asyncio.sleep(wait)
+
+
+def parse_rate_limits(specs: list):
+    '''
+    Parse command-line specs such as "gpt-4:200:40000" (rpm and tpm) or "anthropic-chat:50:" into limits.
+    '''
+    limits = {}
+    for spec in specs or []:
+        key, rpm, tpm = spec.rsplit(':', 2)
+        limits[key] = {'rpm': int(rpm) if rpm else None, 'tpm': int(tpm) if tpm else None}
+    return limits
@@ -0,0 +1,326 @@
+'''
+Scripted stub LLM for offline runs and load tests.
+
+`ChatStub` answers every prompt of the auction (plan, bid, summarize, replan,
+learning and bid parsing) with well-formed, auction-shaped responses. Responses are
+derived from a seeded hash of the conversation, so runs are deterministic, and an
+optional latency distribution, seeded likewise, stands in for provider response times.
+
+Bidding policies are chosen by model name: `stub` (= `stub-truthful`), `stub-conservative`,
+`stub-aggressive` or `stub-random`. Defaults of the other knobs are read from environment
+variables when a stub is built: STUB_SEED, STUB_LATENCY_MEDIAN and STUB_LATENCY_P99 (seconds), and
+STUB_ERROR_RATE (probability of a malformed status JSON, to exercise revision loops).
+'''
+import asyncio
+import hashlib
+import math
+import os
+import random
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import ujson as json
+from pydantic import Field, PrivateAttr
+from langchain.chat_models.base import BaseChatModel
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+from .bid_parser import BID_DECISION_PATTERN, parse_bid_decision
+from .prompt_base import STRUCTURED_BID_INSTRUCTION
+
+
+STUB_POLICIES = ['truthful', 'conservative', 'aggressive', 'random']
+
+ITEM_PATTERN = re.compile(r'\d+\. (.+?), starting price is \$(\d+)\. Your estimated value for this item is \$(\d+)\.')
+BUDGET_PATTERNS = [
+    re.compile(r'Remaining Budget: \$(\d+)'),
+    re.compile(r'"remaining_budget": (\d+)'),
+    re.compile(r'you have a total budget of \$(\d+)'),
+    re.compile(r'\(\$(\d+) left\)'),
+]
+
+
+def get_stub_policy(model_name: str):
+    policy = model_name.split('stub', 1)[-1].strip('-')
+    return policy if policy in STUB_POLICIES else 'truthful'
+
+
+def _to_int(text: str):
+    return int(text.replace(',', ''))
+
+
+def _parse_items(text: str):
+    return {name: (int(price), int(value)) for name, price, value in ITEM_PATTERN.findall(text)}
+
+
+# ****************** Responses ****************** #
+
+def _reply_parse_bid(prompt: str):
+    response = prompt.split('Here is the response:', 1)[-1].rsplit("Don't say anything else", 1)[0]
+    decisions = [(m.start(), -1) for m in re.finditer(r"I'm out|withdraw", response, re.IGNORECASE)]
+    decisions += [(m.start(), _to_int(m.group(1))) for m in re.finditer(r'\$(\d[\d,]*)', response)]
+    if len(decisions) == 0:
+        return 'I cannot tell.'
+    bid = max(decisions)[1]
+    return '-1' if bid < 0 else f'${bid}'
+
+
+def _reply_parse_bids(prompt: str):
+    responses = re.findall(r'<response (\d+)>\n(.*?)\n</response \1>', prompt, re.DOTALL)
+    bids = []
+    for _, response in responses:
+        bid = _reply_parse_bid(f'Here is the response:{response}')
+        bids.append(None if bid.startswith('I cannot') else _to_int(bid.strip('$')))
+    return json.dumps(bids)
+
+
+def _reply_learning():
+    return ("1. Set a firm ceiling for every item before bidding, and stick to it.\n"
+            "2. Save budget for high-value items that appear later in the auction.\n"
+            "3. Raise bids by the minimum increment to avoid overpaying.")
+
+
+def _reply_plan(prompt: str, policy: str):
+    priorities = {}
+    for name, (price, value) in _parse_items(prompt).items():
+        ratio = value / max(price, 1)
+        if policy == 'aggressive':
+            ratio *= 1.3
+        elif policy == 'conservative':
+            ratio *= 0.8
+        priorities[name] = 3 if ratio >= 2 else (2 if ratio >= 1.5 else 1)
+    return f"I will focus on the items with the largest gap between estimated value and starting price.\n{json.dumps(priorities)}"
+
+
+def _parse_status_text(status_text: str):
+    status = {'remaining_budget': 0, 'total_profits': {}, 'winning_bids': {}}
+    section, bidder = None, None
+    for line in status_text.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('* Remaining Budget:'):
+            m = re.search(r'\$(-?\d+)', stripped)
+            status['remaining_budget'] = int(m.group(1)) if m else 0
+        elif stripped.startswith('* Total Profits'):
+            section = 'total_profits'
+        elif stripped.startswith('* Winning Bids'):
+            section = 'winning_bids'
+        elif section == 'total_profits' and stripped.startswith('* '):
+            name, _, amount = stripped[2:].rpartition(': $')
+            status['total_profits'][name] = int(amount)
+        elif section == 'winning_bids' and line.startswith('  * ') and not line.startswith('    '):
+            bidder = stripped[2:].rstrip(':')
+            status['winning_bids'][bidder] = {}
+        elif section == 'winning_bids' and bidder is not None and stripped.startswith('* ') and ': $' in stripped:
+            item, _, amount = stripped[2:].rpartition(': $')
+            status['winning_bids'][bidder][item] = int(amount)
+    return status
+
+
+def _reply_summarize(prompt: str, rng: random.Random, error_rate: float):
+    m = re.search(r"Here's your previous status:\n```\n(.*?)\n```", prompt, re.DOTALL)
+    status = _parse_status_text(m.group(1) if m else '')
+    me = re.search(r'As (.+?), you have to update the status', prompt)
+    me = me.group(1) if me else ''
+
+    sold = re.search(r'Sold! (.+?) to (.+?) at \$(\d+)! The true value for .+? is \$(\d+)\.', prompt)
+    if sold:
+        item, winner, bid, value = sold.group(1), sold.group(2), int(sold.group(3)), int(sold.group(4))
+        status['total_profits'][winner] = status['total_profits'].get(winner, 0) + value - bid
+        status['winning_bids'].setdefault(winner, {})[item] = bid
+        if winner == me:
+            status['remaining_budget'] -= bid
+
+    status_json = json.dumps(status)
+    if rng.random() < error_rate:
+        status_json = status_json[:-1]  # drop the closing bracket
+    return f"The bidders behaved as expected in this round.\n```\n{status_json}\n```"
+
+
+def _bid_state(messages: list):
+    '''
+    Recover the current item, the minimum acceptable bid and the budget from the conversation.
+    '''
+    item, next_bid, budget, values = None, None, None, {}
+    for _, content in messages:
+        for name, (_, value) in _parse_items(content).items():
+            values[name] = value
+
+    for role, content in reversed(messages):
+        if role != 'human':
+            continue
+        if budget is None:
+            for pattern in BUDGET_PATTERNS:
+                found = pattern.findall(content)
+                if found:
+                    budget = int(found[-1])
+                    break
+        if next_bid is None:
+            advance = re.search(r'advance previous highest bid \(\$(\d+)\) by at least \$(\d+)', content)
+            starting = re.search(r'lower than the starting bid \(\$(\d+)\)', content)
+            if advance:
+                next_bid = int(advance.group(1)) + int(advance.group(2))
+            elif starting:
+                next_bid = int(starting.group(1))
+        if item is None:
+            highest = re.search(r'Now we have \$(\d+) from .+? for (.+?)\. The minimum increase over this highest bid is \$(\d+)', content)
+            opening = re.search(r'The starting price for bidding for (.+?) is \$(\d+)', content)
+            lowered = re.search(r'lower the starting bid to \$(\d+) for (.+?) to spark', content)
+            if highest:
+                item = highest.group(2)
+                next_bid = next_bid or int(highest.group(1)) + int(highest.group(3))
+            elif lowered:
+                item = lowered.group(2)
+                next_bid = next_bid or int(lowered.group(1))
+            elif opening:
+                item = opening.group(1)
+                next_bid = next_bid or int(opening.group(2))
+        if item is not None and budget is not None:
+            break
+    return item, next_bid, budget, values
+
+
+def _reply_bid(messages: list, policy: str, rng: random.Random):
+    item, next_bid, budget, values = _bid_state(messages)
+    if item is None or next_bid is None:
+        return "I'm not sure what is being auctioned, so I'm out!"
+
+    value = values.get(item, int(next_bid * 1.5))
+    ceiling = {
+        'truthful': value,
+        'conservative': 0.8 * value,
+        'aggressive': 1.2 * value,
+        'random': value * rng.uniform(0.6, 1.3),
+    }[policy]
+    if budget is not None:
+        ceiling = min(ceiling, budget)
+
+    if next_bid > ceiling:
+        return f"The price of {item} has reached my limit of ${int(ceiling)}, so I'd better save my budget. I'm out!"
+    bid = next_bid
+    if policy in ['aggressive', 'random'] and rng.random() < 0.3:
+        bid = min(int(ceiling), next_bid + int(0.1 * next_bid))
+    return f"{item} is still below my estimated value of ${value}, and I can afford it. I bid ${bid}!"
+
+
+def structured_bid_reply(text: str):
+    '''
+    A free-text bid as the decision object of the structured bid mode.
+    '''
+    bid = parse_bid_decision(text)
+    decision = {'rationale': BID_DECISION_PATTERN.sub('', text).strip()}
+    if bid is None or bid < 0:
+        decision.update(action='withdraw', amount=0)
+    else:
+        decision.update(action='bid', amount=bid)
+    return json.dumps(decision)
+
+
+def stub_reply(messages: list, policy: str = 'truthful', seed: int = 0, error_rate: float = 0.):
+    '''
+    :param messages: a list of (role, content), role being 'system', 'human' or 'ai'
+    :return: the response text, and the seeded RNG used to produce it
+    '''
+    digest = hashlib.sha256(json.dumps([seed, messages]).encode('utf-8')).hexdigest()
+    rng = random.Random(digest)
+    last = messages[-1][1] if messages else ''
+
+    if 'responses from bidders in an auction' in last:
+        text = _reply_parse_bids(last)
+    elif 'parse a response from a bidder' in last:
+        text = _reply_parse_bid(last)
+    elif 'Review and reflect on the historical data' in last:
+        text = _reply_learning()
+    elif 'Output the status JSON first and the priority JSON last' in last:
+        text = _reply_summarize(last, rng, error_rate) + '\n\n' + _reply_plan(last, policy)
+    elif 'update the status of the auction' in last:
+        text = _reply_summarize(last, rng, error_rate)
+    elif 'Please revise the status JSON' in last:
+        prompts = [c for r, c in messages if 'update the status of the auction' in c]
+        text = _reply_summarize(prompts[-1] if prompts else '', rng, 0.)
+        if prompts and 'Output the status JSON first and the priority JSON last' in prompts[-1]:
+            text += '\n\n' + _reply_plan(prompts[-1], policy)
+    elif 'priorities' in last or 'priority list' in last:
+        plan_prompts = [c for r, c in messages if r == 'human' and _parse_items(c)]
+        text = _reply_plan(plan_prompts[-1] if plan_prompts else last, policy)
+    elif STRUCTURED_BID_INSTRUCTION in last:
+        text = structured_bid_reply(_reply_bid(messages, policy, rng))
+    else:
+        text = _reply_bid(messages, policy, rng)
+    return text, rng
+
+
+def split_stream_chunks(text: str, n_words: int = 3):
+    words = re.findall(r'\S+\s*|\s+', text)
+    return [''.join(words[i:i+n_words]) for i in range(0, len(words), n_words)] or ['']
+
+
+def sample_latency(rng: random.Random, median: float, p99: float):
+    if median <= 0:
+        return 0.
+    # log-normal with the given median and 99th percentile
+    sigma = math.log(max(p99, median) / median) / 2.326
+    return median * math.exp(sigma * rng.gauss(0, 1))
+
+
+class ChatStub(BaseChatModel):
+    model_name: str = 'stub'
+    temperature: float = 0.
+    seed: int = Field(default_factory=lambda: int(os.environ.get('STUB_SEED', 0)))
+    latency_median: float = Field(default_factory=lambda: float(os.environ.get('STUB_LATENCY_MEDIAN', 0)))
+    latency_p99: float = Field(default_factory=lambda: float(os.environ.get('STUB_LATENCY_P99', 0)))
+    error_rate: float = Field(default_factory=lambda: float(os.environ.get('STUB_ERROR_RATE', 0)))
+    _sent: Dict[str, int] = PrivateAttr(default_factory=dict)     # times each conversation was sent
+
+    @property
+    def _llm_type(self):
+        return 'stub-chat'
+
+    @property
+    def _identifying_params(self):
+        return {'model_name': self.model_name, 'seed': self.seed}
+
+    def _reply(self, messages: List[BaseMessage], max_tokens: int = None, sample_seed: int = 0):
+        text, _ = stub_reply([(m.type, m.content) for m in messages],
+                               policy=get_stub_policy(self.model_name),
+                               seed=[self.seed, sample_seed] if sample_seed else self.seed,
+                               error_rate=self.error_rate)
+        if max_tokens is not None:
+            text = text[:max_tokens * 4]
+        # latency is seeded by the conversation and how many times it was sent, so that runs are
+        # reproducible whatever the order of concurrent calls, and a duplicate request can be faster
+        digest = hashlib.sha256(json.dumps([m.content for m in messages]).encode('utf-8')).hexdigest()
+        n_sent = self._sent.get(digest, 0)
+        self._sent[digest] = n_sent + 1
+        latency = sample_latency(random.Random(f'{self.seed}-{digest}-{n_sent}'), self.latency_median, self.latency_p99)
+        return text, latency
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, max_tokens: int = None, sample_seed: int = 0, **kwargs: Any):
+        text, latency = self._reply(messages, max_tokens, sample_seed)
+        time.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, max_tokens: int = None, sample_seed: int = 0, **kwargs: Any):
+        text, latency = self._reply(messages, max_tokens, sample_seed)
+        await asyncio.sleep(latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, max_tokens: int = None, sample_seed: int = 0, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        text, latency = self._reply(messages, max_tokens, sample_seed)
+        chunks = split_stream_chunks(text)
+        # a third of the latency goes to the first token, the rest is spread over the chunks
+        time.sleep(latency / 3)
+        for chunk in chunks:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+            time.sleep(latency * 2 / 3 / len(chunks))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, max_tokens: int = None, sample_seed: int = 0, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        text, latency = self._reply(messages, max_tokens, sample_seed)
+        chunks = split_stream_chunks(text)
+        await asyncio.sleep(latency / 3)
+        for chunk in chunks:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+            await asyncio.sleep(latency * 2 / 3 / len(chunks))
+
+    def get_num_tokens(self, text: str):
+        # rough estimate, avoids downloading a tokenizer
+        return len(text) // 4 + 1
@@ -0,0 +1,351 @@
+'''
+Local OpenAI/Anthropic-compatible stub server for end-to-end load tests without internet.
+
+It speaks the OpenAI chat-completions format (`/v1/chat/completions`), the Anthropic
+text-completions format used by `ChatAnthropic` (`/v1/complete`) and the Anthropic messages
+format (`/v1/messages`), with or without streaming. Contents come from the scripted
+policies of `stub_llm.py`, so auctions run to completion.
+
+Faults are injected with configurable rates: latency drawn from a log-normal with the given
+median and p99, 429s (with a retry-after header) from random throttling or when the
+requests-per-minute or in-flight capacity is exceeded, 5xx errors, and responses cut
+in the middle of their JSON.
+
+Usage:
+    python -m src.stub_server --port 8000 --latency_median 1 --latency_p99 8 --rpm 600 --error_rate_429 0.02
+    OPENAI_API_KEY=stub ANTHROPIC_API_KEY=stub python auction_workflow.py -i data/exp_base --api_base http://127.0.0.1:8000/v1
+
+`GET /stats` reports request counts, injected faults, throughput and latency percentiles.
+'''
+import argparse
+import asyncio
+import random
+import re
+import time
+import uuid
+from collections import deque
+import ujson as json
+from aiohttp import web
+from .stub_llm import stub_reply, structured_bid_reply, get_stub_policy, sample_latency, split_stream_chunks
+
+
+OPENAI_ROLES = {'system': 'system', 'user': 'human', 'assistant': 'ai'}
+
+
+def _num_tokens(text: str):
+    return len(text) // 4 + 1
+
+
+def _percentile(values: list, p: float):
+    if len(values) == 0:
+        return 0.
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def _block_text(content):
+    # messages API contents are a string or a list of blocks
+    if isinstance(content, list):
+        return ''.join(block.get('text', '') for block in content if isinstance(block, dict))
+    return content or ''
+
+
+def parse_anthropic_prompt(prompt: str):
+    '''
+    Split a "\\n\\nHuman: ... \\n\\nAssistant:" prompt into (role, content) messages.
+    '''
+    messages = []
+    parts = re.split(r'\n\n(Human|Assistant):', prompt)
+    if parts[0].strip():
+        messages.append(('system', parts[0].strip()))
+    for role, content in zip(parts[1::2], parts[2::2]):
+        if content.strip():
+            messages.append(('human' if role == 'Human' else 'ai', content.strip()))
+    return messages
+
+
+class StubServer():
+    def __init__(self,
+                 policy: str = 'truthful',
+                 seed: int = 0,
+                 latency_median: float = 0.,
+                 latency_p99: float = 0.,
+                 error_rate_429: float = 0.,
+                 error_rate_5xx: float = 0.,
+                 truncate_rate: float = 0.,
+                 status_error_rate: float = 0.,
+                 rpm: int = None,
+                 max_in_flight: int = None,
+                 stream_chunk_words: int = 3):
+        self.policy = policy
+        self.seed = seed
+        self.latency_median = latency_median
+        self.latency_p99 = latency_p99
+        self.error_rate_429 = error_rate_429
+        self.error_rate_5xx = error_rate_5xx
+        self.truncate_rate = truncate_rate
+        self.status_error_rate = status_error_rate
+        self.rpm = rpm
+        self.max_in_flight = max_in_flight
+        self.stream_chunk_words = stream_chunk_words
+
+        self.rng = random.Random(seed)
+        self.in_flight = 0
+        self.recent_requests = deque()  # start times within the last minute, for rpm
+        self.start_time = time.time()
+        self.counts = {'requests': 0, 'ok': 0, 'disconnected': 0, '429': 0, '5xx': 0, 'truncated': 0}
+        self.latencies = deque(maxlen=100000)
+        self.connections = set()        # client (host, port) pairs, to tell whether connections are kept alive
+
+    # ****************** Faults ****************** #
+
+    def _throttle_wait(self):
+        '''
+        Seconds the client should wait if this request is throttled, else None.
+        '''
+        now = time.time()
+        while self.recent_requests and now - self.recent_requests[0] > 60:
+            self.recent_requests.popleft()
+        if self.rpm is not None and len(self.recent_requests) >= self.rpm:
+            return 60 - (now - self.recent_requests[0])
+        if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+            return 1.
+        if self.rng.random() < self.error_rate_429:
+            return 1.
+        return None
+
+    def _error_response(self, provider: str, status: int, message: str, headers: dict = None):
+        if provider == 'openai':
+            body = {'error': {'message': message, 'type': 'rate_limit_exceeded' if status == 429 else 'server_error', 'code': None}}
+        else:
+            body = {'type': 'error', 'error': {'type': 'rate_limit_error' if status == 429 else 'api_error', 'message': message}}
+        return web.json_response(body, status=status, headers=headers)
+
+    # ****************** Payloads ****************** #
+
+    def _reply(self, messages: list, model: str):
+        policy = get_stub_policy(model) if 'stub' in model else self.policy
+        text, _ = stub_reply(messages, policy=policy, seed=self.seed, error_rate=self.status_error_rate)
+        return text
+
+    def _openai_body(self, model: str, text: str, prompt_tokens: int, function_name: str = None):
+        if function_name is None:
+            message, finish_reason = {'role': 'assistant', 'content': text}, 'stop'
+        else:
+            message, finish_reason = {'role': 'assistant', 'content': None, 'function_call': {'name': function_name, 'arguments': text}}, 'function_call'
+        return {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:24]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': message, 'finish_reason': finish_reason}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': _num_tokens(text), 'total_tokens': prompt_tokens + _num_tokens(text)},
+        }
+
+    def _openai_chunks(self, model: str, deltas: list):
+        chunk_id = f'chatcmpl-{uuid.uuid4().hex[:24]}'
+        for i, delta in enumerate(deltas + [None]):
+            yield None, {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'delta': {} if delta is None else ({'role': 'assistant', 'content': delta} if i == 0 else {'content': delta}),
+                    'finish_reason': 'stop' if delta is None else None,
+                }],
+            }
+
+    def _complete_body(self, model: str, text: str):
+        return {'type': 'completion', 'id': f'compl_{uuid.uuid4().hex[:24]}', 'completion': text, 'stop_reason': 'stop_sequence', 'model': model}
+
+    def _complete_chunks(self, model: str, deltas: list):
+        for i, delta in enumerate(deltas):
+            yield 'completion', {'type': 'completion', 'completion': delta, 'stop_reason': 'stop_sequence' if i == len(deltas) - 1 else None, 'model': model}
+
+    def _messages_body(self, model: str, text: str, prompt_tokens: int):
+        return {
+            'id': f'msg_{uuid.uuid4().hex[:24]}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': model,
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {'input_tokens': prompt_tokens, 'output_tokens': _num_tokens(text)},
+        }
+
+    def _messages_chunks(self, model: str, deltas: list, prompt_tokens: int):
+        message = self._messages_body(model, '', prompt_tokens)
+        message['content'], message['stop_reason'] = [], None
+        yield 'message_start', {'type': 'message_start', 'message': message}
+        yield 'content_block_start', {'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}}
+        for delta in deltas:
+            yield 'content_block_delta', {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': delta}}
+        yield 'content_block_stop', {'type': 'content_block_stop', 'index': 0}
+        yield 'message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None}, 'usage': {'output_tokens': _num_tokens(''.join(deltas))}}
+        yield 'message_stop', {'type': 'message_stop'}
+
+    # ****************** Handlers ****************** #
+
+    def _parse_request(self, path: str, payload: dict):
+        '''
+        :return: the provider, the model, and the conversation as (role, content) messages
+        '''
+        model = payload.get('model', '')
+        if path.endswith('chat/completions'):
+            messages = [(OPENAI_ROLES.get(m['role'], m['role']), _block_text(m.get('content'))) for m in payload['messages']]
+            return 'openai', model, messages
+        elif path.endswith('messages'):
+            messages = [('system', _block_text(payload['system']))] if payload.get('system') else []
+            messages += [(OPENAI_ROLES.get(m['role'], m['role']), _block_text(m.get('content'))) for m in payload['messages']]
+            return 'anthropic-messages', model, messages
+        elif path.endswith('complete'):
+            return 'anthropic-complete', model, parse_anthropic_prompt(payload['prompt'])
+        raise web.HTTPNotFound(text=f'Unknown endpoint: {path}')
+
+    async def handle(self, request: web.Request):
+        payload = await request.json()
+        provider, model, messages = self._parse_request(request.path, payload)
+        error_format = 'openai' if provider == 'openai' else 'anthropic'
+        self.counts['requests'] += 1
+        self.connections.add(request.transport.get_extra_info('peername') if request.transport else None)
+
+        wait = self._throttle_wait()
+        if wait is not None:
+            self.counts['429'] += 1
+            return self._error_response(error_format, 429, 'Rate limit reached, please retry later.', {'retry-after': f'{wait:.2f}'})
+
+        self.recent_requests.append(time.time())
+        self.in_flight += 1
+        start = time.time()
+        try:
+            latency = sample_latency(self.rng, self.latency_median, self.latency_p99)
+            if self.rng.random() < self.error_rate_5xx:
+                await asyncio.sleep(latency * self.rng.random())
+                self.counts['5xx'] += 1
+                return self._error_response(error_format, self.rng.choice([500, 502, 503]), 'The server had an error while processing your request.')
+
+            text = self._reply(messages, model)
+            # a forced function call (structured bids) gets its arguments
+            function_call = payload.get('function_call') if provider == 'openai' else None
+            function_name = function_call.get('name') if isinstance(function_call, dict) else None
+            if function_name is not None:
+                text = structured_bid_reply(text)
+            max_tokens = payload.get('max_tokens') or payload.get('max_tokens_to_sample')
+            if max_tokens:
+                text = text[:max_tokens * 4]
+            prompt_tokens = sum(_num_tokens(content) for _, content in messages)
+            truncate = self.rng.random() < self.truncate_rate
+            if payload.get('stream'):
+                response, outcome = await self._stream(request, provider, model, text, prompt_tokens, latency, truncate)
+            else:
+                await asyncio.sleep(latency)
+                if provider == 'openai':
+                    body = self._openai_body(model, text, prompt_tokens, function_name)
+                elif provider == 'anthropic-messages':
+                    body = self._messages_body(model, text, prompt_tokens)
+                else:
+                    body = self._complete_body(model, text)
+                body = json.dumps(body)
+                if truncate:
+                    body = body[:len(body) // 2]
+                response = web.Response(text=body, content_type='application/json')
+                outcome = 'truncated' if truncate else 'ok'
+            self.counts[outcome] += 1
+            self.latencies.append(time.time() - start)
+            return response
+        except asyncio.CancelledError:
+            self.counts['disconnected'] += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def _stream(self, request: web.Request, provider: str, model: str, text: str, prompt_tokens: int, latency: float, truncate: bool):
+        deltas = split_stream_chunks(text, self.stream_chunk_words)
+        if provider == 'openai':
+            events = list(self._openai_chunks(model, deltas))
+        elif provider == 'anthropic-messages':
+            events = list(self._messages_chunks(model, deltas, prompt_tokens))
+        else:
+            events = list(self._complete_chunks(model, deltas))
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        # a third of the latency goes to the first token, the rest is spread over the chunks
+        await asyncio.sleep(latency / 3)
+        cut = self.rng.randrange(len(events)) if truncate else None
+        try:
+            for i, (event, data) in enumerate(events):
+                data = json.dumps(data)
+                if i == cut:
+                    await response.write(f'data: {data[:len(data) // 2]}'.encode('utf-8'))
+                    return response, 'truncated'    # the connection closes mid-event
+                message = f'event: {event}\ndata: {data}\n\n' if event else f'data: {data}\n\n'
+                await response.write(message.encode('utf-8'))
+                await asyncio.sleep(latency * 2 / 3 / len(events))
+            if provider == 'openai':
+                await response.write(b'data: [DONE]\n\n')
+            await response.write_eof()
+        except ConnectionResetError:
+            # the client hung up early, e.g., once it saw the bid decision
+            return response, 'disconnected'
+        return response, 'ok'
+
+    async def handle_stats(self, request: web.Request):
+        return web.json_response(self.stats())
+
+    def stats(self):
+        elapsed = time.time() - self.start_time
+        latencies = list(self.latencies)
+        return {
+            **self.counts,
+            'in_flight': self.in_flight,
+            'connections': len(self.connections),
+            'requests_per_sec': round((self.counts['ok'] + self.counts['disconnected']) / max(elapsed, 1e-8), 2),
+            'latency_p50': round(_percentile(latencies, 50), 3),
+            'latency_p90': round(_percentile(latencies, 90), 3),
+            'latency_p99': round(_percentile(latencies, 99), 3),
+        }
+
+    def make_app(self):
+        app = web.Application(client_max_size=64 * 1024 ** 2)
+        app.router.add_get('/stats', self.handle_stats)
+        # any base path works, e.g., ".../v1/chat/completions" or ".../v1/v1/complete"
+        app.router.add_post('/{path:.*}', self.handle)
+        return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--policy', type=str, default='truthful', help='Bidding policy for model names without "stub-<policy>", e.g., gpt-4.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency_median', type=float, default=0., help='Median response latency in seconds.')
+    parser.add_argument('--latency_p99', type=float, default=0., help='99th percentile of response latency in seconds.')
+    parser.add_argument('--error_rate_429', type=float, default=0., help='Probability of a random 429.')
+    parser.add_argument('--error_rate_5xx', type=float, default=0., help='Probability of a 500/502/503.')
+    parser.add_argument('--truncate_rate', type=float, default=0., help='Probability of cutting the response JSON in the middle.')
+    parser.add_argument('--status_error_rate', type=float, default=0., help='Probability of a malformed status JSON in summaries.')
+    parser.add_argument('--rpm', type=int, help='Requests per minute before answering 429.')
+    parser.add_argument('--max_in_flight', type=int, help='Concurrent requests before answering 429.')
+    args = parser.parse_args()
+
+    server = StubServer(
+        policy=args.policy,
+        seed=args.seed,
+        latency_median=args.latency_median,
+        latency_p99=args.latency_p99,
+        error_rate_429=args.error_rate_429,
+        error_rate_5xx=args.error_rate_5xx,
+        truncate_rate=args.truncate_rate,
+        status_error_rate=args.status_error_rate,
+        rpm=args.rpm,
+        max_in_flight=args.max_in_flight,
+    )
+    try:
+        web.run_app(server.make_app(), host=args.host, port=args.port)
+    finally:
+        print(json.dumps(server.stats(), indent=4))
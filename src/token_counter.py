@@ -0,0 +1,96 @@
+'''
+Cached token counting for chat messages.
+
+A message list is counted as the sum of its per-message counts, each cached by
+tokenizer and content, so the system message, plan and growing bid history are
+only tokenized once however many times they are re-sent.
+'''
+import threading
+from collections import OrderedDict
+from typing import List
+from langchain.base_language import BaseLanguageModel
+from langchain.callbacks.openai_info import MODEL_COST_PER_1K_TOKENS, get_openai_token_cost_for_model, standardize_model_name
+from langchain.schema import BaseMessage
+
+
+# USD per 1K (input, output) tokens, for models not priced by the OpenAI callback
+MODEL_PRICES = {
+    'claude-instant-1': (0.0008, 0.0024),
+    'claude-2': (0.008, 0.024),
+}
+
+
+class TokenCounter():
+    def __init__(self, max_entries: int = 200000):
+        self.max_entries = max_entries
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self._unavailable = set()   # tokenizers that failed to load, e.g., tiktoken without internet
+
+    def _tokenizer_key(self, llm: BaseLanguageModel):
+        return (llm._llm_type, getattr(llm, 'model_name', None) or getattr(llm, 'model', None))
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+        count = compute()
+        with self._lock:
+            self._counts[key] = count
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return count
+
+    def _tokenize(self, llm: BaseLanguageModel, compute, text: str):
+        tokenizer = self._tokenizer_key(llm)
+        if tokenizer not in self._unavailable:
+            try:
+                return compute()
+            except Exception as e:
+                print(f'Tokenizer of {tokenizer} is unavailable, estimating token counts from text length instead: {e}')
+                self._unavailable.add(tokenizer)
+        return len(text) // 4 + 1
+
+    def _list_overhead(self, llm: BaseLanguageModel):
+        # tokens added once per request, e.g., OpenAI primes every reply with <im_start>assistant
+        key = (self._tokenizer_key(llm), 'overhead')
+        return self._cached(key, lambda: self._tokenize(llm, lambda: llm.get_num_tokens_from_messages([]), ''))
+
+    def count_message(self, llm: BaseLanguageModel, message: BaseMessage):
+        key = (self._tokenizer_key(llm), message.type, message.content)
+        return self._cached(key, lambda: self._tokenize(
+            llm, lambda: llm.get_num_tokens_from_messages([message]) - self._list_overhead(llm), message.content))
+
+    def count_messages(self, llm: BaseLanguageModel, messages: List[BaseMessage]):
+        return self._list_overhead(llm) + sum(self.count_message(llm, msg) for msg in messages)
+
+    def count_text(self, llm: BaseLanguageModel, text: str):
+        key = (self._tokenizer_key(llm), 'text', text)
+        return self._cached(key, lambda: self._tokenize(llm, lambda: llm.get_num_tokens(text), text))
+
+
+token_counter = TokenCounter()
+
+
+def count_tokens(llm: BaseLanguageModel, messages: List[BaseMessage]):
+    return token_counter.count_messages(llm, messages)
+
+
+def estimate_cost(llm: BaseLanguageModel, messages: List[BaseMessage], output_text: str):
+    '''
+    Estimate the cost of a call from cached token counts. Return 0 for models without a known price.
+    '''
+    model = getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or ''
+    if llm._llm_type == 'openai-chat' and standardize_model_name(model) in MODEL_COST_PER_1K_TOKENS:
+        # streamed OpenAI responses come without usage
+        input_tokens = token_counter.count_messages(llm, messages)
+        output_tokens = token_counter.count_text(llm, output_text)
+        return (get_openai_token_cost_for_model(model, input_tokens)
+                + get_openai_token_cost_for_model(model, output_tokens, is_completion=True))
+    for prefix, (input_price, output_price) in MODEL_PRICES.items():
+        if model.startswith(prefix):
+            input_tokens = token_counter.count_messages(llm, messages)
+            output_tokens = token_counter.count_text(llm, output_text)
+            return (input_tokens * input_price + output_tokens * output_price) / 1000
+    return 0
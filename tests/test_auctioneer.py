@@ -0,0 +1,26 @@
+import asyncio
+from src.auctioneer_base import Auctioneer
+
+
+UNSURE_BIDS = ['Maybe I would go up to $1200.', 'Hard to say, $1300 could work.']
+
+
+def parse_with(monkeypatch, parser_responses):
+    async def acall_parser(self, prompt):
+        return parser_responses.pop(0)
+    monkeypatch.setattr(Auctioneer, '_acall_parser', acall_parser)
+    auctioneer = Auctioneer(parse_model_name='stub')
+    bids = asyncio.run(auctioneer.aparse_bids(UNSURE_BIDS))
+    return bids, auctioneer.parse_stats()
+
+
+def test_batch_parse(monkeypatch):
+    bids, stats = parse_with(monkeypatch, ['[1200, 1300]'])
+    assert bids == [1200, 1300]
+    assert (stats['llm_parse_cnt'], stats['batch_parse_cnt']) == (2, 1)
+
+
+def test_failed_batch_is_not_counted(monkeypatch):
+    bids, stats = parse_with(monkeypatch, ['I cannot tell.', '$1200', '$1300'])
+    assert bids == [1200, 1300]
+    assert (stats['llm_parse_cnt'], stats['batch_parse_cnt']) == (2, 0)
@@ -0,0 +1,41 @@
+import pytest
+from src.bid_parser import FAST_PARSE_THRESHOLD, rule_parse_bid
+
+
+@pytest.mark.parametrize('text, bid', [
+    ("I bid $1,200!", 1200),
+    ("I bid $1,000,000!", 1000000),
+    ("I bid $1200.50!", 1200),
+    ("I bid $1.2k!", 1200),
+    ("I'm out!", -1),
+])
+def test_canonical_bids(text, bid):
+    assert rule_parse_bid(text) == (bid, 1.)
+
+
+@pytest.mark.parametrize('text', [
+    "I bid $1,2000!",
+    "I bid $12,00!",
+    "I bid $1,000,00!",
+])
+def test_malformed_digit_groups_go_to_the_llm_parser(text):
+    assert rule_parse_bid(text) == (None, 0.)
+
+
+@pytest.mark.parametrize('text, bid', [
+    ("I bid $1,500! I will withdraw if it goes above $2,000.", 1500),
+    ("I bid $1200! I would drop out if others go higher.", 1200),
+    ("I'm out! I would bid $2000 if I had more budget.", -1),
+    ("I will withdraw if needed, but I bid $1400!", 1400),
+])
+def test_conditional_decisions_do_not_count(text, bid):
+    assert rule_parse_bid(text) == (bid, 1.)
+
+
+@pytest.mark.parametrize('text', [
+    "I will pass on the chance to lowball and bid $1200.",
+    "I bid $1,200! Actually, I will withdraw.",
+    "If it goes above $500, I'm out!",
+])
+def test_unclear_decisions_go_to_the_llm_parser(text):
+    assert rule_parse_bid(text)[1] < FAST_PARSE_THRESHOLD
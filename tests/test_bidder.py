@@ -0,0 +1,27 @@
+from src.bidder_base import Bidder
+from src.item_base import create_items
+
+
+def make_bidder(**kwargs):
+    bidder = Bidder.create(name='Bidder 1', model_name='stub', budget=10000, desire='maximize_profit',
+                           plan_strategy='adaptive', correct_belief=True, auction_hash='test', **kwargs)
+    bidder.get_plan_instruct(create_items('data/stub/items_demo.jsonl'))
+    bidder.cur_plan = '{"Widget A": 2, "Gadget B": 1}'
+    return bidder
+
+
+def test_kept_plan_bid_prompt_has_the_latest_status():
+    bidder = make_bidder(lazy_replan=True, replan_every=0)
+    bidder.win_bid(bidder._get_cur_item(), 100)
+    bidder.status_quo = bidder._oracle_status_quo()     # as summarized after the item
+    assert bidder.replan_trigger() == ''
+    bidder.replan(bidder.get_replan_instruct())
+
+    bid_instruct = bidder.get_bid_instruct('Gadget B, starting at $1000.', 0)
+    assert '"remaining_budget": 9900' in bid_instruct
+
+
+def test_replanned_bid_prompt_leaves_the_status_to_the_plan():
+    bidder = make_bidder()
+    bid_instruct = bidder.get_bid_instruct('Widget A, starting at $1000.', 0)
+    assert 'remaining_budget' not in bid_instruct
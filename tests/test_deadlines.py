@@ -0,0 +1,36 @@
+import asyncio
+import httpx
+import pytest
+from src.deadlines import Deadlines
+
+
+async def slow():
+    await asyncio.sleep(1)
+    return 'late'
+
+
+def test_phase_deadline_falls_back():
+    assert asyncio.run(Deadlines(phase_timeout=0.01).arun(slow())) == (None, 'phase deadline')
+
+
+def test_auction_deadline_counts_from_start():
+    deadlines = Deadlines(auction_timeout=0)
+    assert not deadlines.expired()
+    assert deadlines.time_left() is None
+    deadlines.start()
+    assert deadlines.expired()
+    assert asyncio.run(deadlines.arun(slow())) == (None, 'auction deadline')
+
+
+def test_llm_errors_fall_back():
+    async def connection_error():
+        raise httpx.ConnectError('Connection error.')
+    result, why = asyncio.run(Deadlines(phase_timeout=1).arun(connection_error()))
+    assert result is None and why.startswith('ConnectError')
+
+
+def test_other_errors_are_raised():
+    async def bug():
+        return {}['missing']
+    with pytest.raises(KeyError):
+        asyncio.run(Deadlines(phase_timeout=1).arun(bug()))
@@ -0,0 +1,16 @@
+import pytest
+from src.json_repair import repair_json
+
+
+@pytest.mark.parametrize('text, data', [
+    ('{"a": "x, }", "b": 1,}', {'a': 'x, }', 'b': 1}),
+    ('{"status": "spent $1,200 on A", "remaining_budget": $8,800}', {'status': 'spent $1,200 on A', 'remaining_budget': 8800}),
+    ("{'Item A': 3, 'Bob's Item': 2}", {'Item A': 3, "Bob's Item": 2}),
+])
+def test_string_values_are_kept(text, data):
+    assert repair_json(text)[0] == data
+
+
+def test_common_fixes():
+    text = "```json\n{'remaining_budget': 10000 - 1200, 'won': True, 'total_profits': {'Bidder 1': $1,000,"
+    assert repair_json(text)[0] == {'remaining_budget': 8800, 'won': True, 'total_profits': {'Bidder 1': 1000}}
@@ -0,0 +1,11 @@
+from langchain.chat_models import ChatOpenAI
+from langchain.schema import HumanMessage
+from src.llm_cache import make_cache_key
+
+
+def test_cache_key_tells_endpoints_apart():
+    messages = [HumanMessage(content='Hello')]
+    provider = ChatOpenAI(model='gpt-4', temperature=0, openai_api_key='test')
+    stub_server = ChatOpenAI(model='gpt-4', temperature=0, openai_api_key='test', openai_api_base='http://127.0.0.1:8000/v1')
+    assert make_cache_key(provider, messages) != make_cache_key(stub_server, messages)
+    assert make_cache_key(provider, messages) == make_cache_key(ChatOpenAI(model='gpt-4', temperature=0, openai_api_key='other'), messages)
@@ -0,0 +1,23 @@
+import asyncio
+import httpx
+import pytest
+from src.llm_retry import RetryController
+
+
+def run_failing(error):
+    attempts = []
+    async def call():
+        attempts.append(1)
+        raise error
+    retry = RetryController(max_attempts=3, base_delay=0., max_delay=0.)
+    with pytest.raises(type(error)):
+        asyncio.run(retry.run('test', call))
+    return len(attempts), retry.get_concurrency('test').in_flight
+
+
+def test_llm_errors_are_retried():
+    assert run_failing(httpx.ConnectError('Connection error.')) == (3, 0)
+
+
+def test_other_errors_are_raised_at_once():
+    assert run_failing(ValueError('bad prompt')) == (1, 0)
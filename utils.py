@@ -1,6 +1,9 @@
 import ujson as json
 import re
 import traceback
+from functools import lru_cache
+from typing import NamedTuple
+from src.bid_parser import BID_DECISION_PATTERN
 
 
 def trace_back(error_msg):
@@ -10,17 +13,7 @@ def trace_back(error_msg):
 
 
 def extract_numbered_list(paragraph):
-    # Updated regular expression to match numbered list
-    # It looks for:
-    # - start of line
-    # - one or more digits
-    # - a period or parenthesis
-    # - optional whitespace
-    # - any character (captured in a group) until the end of line or a new number
-    pattern = r"^\s*(\d+[.)]\s?.*?)(?=\s*\d+[.)]|$)"
-    
-    matches = re.findall(pattern, paragraph, re.DOTALL | re.MULTILINE)
-    return [match.strip() for match in matches]
+    return list(parse_response(paragraph).numbered_list)
 
 
 def chunks(lst, n):
@@ -46,28 +39,86 @@ def LoadJsonL(filename):
 
 
 def extract_jsons_from_text(text):
-    json_dicts = []
-    stack = []
-    start_index = None
-    
-    for i, char in enumerate(text):
-        if char == '{':
-            stack.append(char)
-            if start_index is None:
-                start_index = i
-        elif char == '}':
-            if stack:
-                stack.pop()
-            if not stack and start_index is not None:
-                json_candidate = text[start_index:i+1]
+    json_dicts = parse_response(text).jsons()
+    if len(json_dicts) == 0: json_dicts = [{}]
+    return json_dicts
+
+
+# ****************** Response Parsing ****************** #
+
+JSON_TOKEN = re.compile(r'[{}]')
+LIST_ITEM = re.compile(r'\s*(\d+[.)])(\s?)')
+NEXT_LIST_ITEM = re.compile(r'\s*\d+[.)]')
+
+
+class ParsedResponse(NamedTuple):
+    json_spans: tuple       # source of every parsable top-level JSON object
+    numbered_list: tuple    # items of numbered lists, e.g., "1. Save budget for ..."
+    bid_decisions: tuple    # price of every "I bid $xxx!", -1 for "I'm out!"
+
+    def jsons(self):
+        '''
+        The JSON objects, decoded on every call: responses are parsed once and shared, and callers
+        may change the objects. Decoding a span again is cheaper than a deep copy of its object.
+        '''
+        return [json.loads(span) for span in self.json_spans]
+
+    @property
+    def bid_decision(self):
+        return self.bid_decisions[-1] if self.bid_decisions else None
+
+
+def _json_spans(text):
+    # jump from brace to brace, trying every balanced span from the outermost brace
+    spans = []
+    depth = 0
+    start = None
+    for m in JSON_TOKEN.finditer(text):
+        if m.group() == '{':
+            if depth == 0:
+                start = m.start()
+            depth += 1
+        elif depth > 0:
+            depth -= 1
+            if depth == 0:
+                span = text[start:m.end()]
                 try:
-                    parsed_json = json.loads(json_candidate)
-                    json_dicts.append(parsed_json)
-                    start_index = None
-                except json.JSONDecodeError:
+                    json.loads(span)
+                    spans.append(span)
+                except ValueError:
                     pass
-                finally:
-                    start_index = None
-    
-    if len(json_dicts) == 0: json_dicts = [{}]
-    return json_dicts
\ No newline at end of file
+    return spans
+
+
+def _numbered_list(text):
+    # line by line, same items as r"^\s*(\d+[.)]\s?.*?)(?=\s*\d+[.)]|$)" with re.DOTALL | re.MULTILINE
+    items = []
+    lines = text.split('\n')
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        i += 1
+        if not line.lstrip()[:1].isdecimal():
+            continue
+        m = LIST_ITEM.match(line)
+        if m is None:
+            continue
+        rest = line[m.end():]
+        if rest == '' and m.group(2) == '' and i < len(lines):
+            # a number at the end of a line goes on with the next line
+            cut = NEXT_LIST_ITEM.search(lines[i])
+            if cut is None or cut.start() > 0:
+                rest = '\n' + lines[i]
+                i += 1
+        cut = NEXT_LIST_ITEM.search(rest)
+        items.append((m.group(1) + m.group(2) + (rest if cut is None else rest[:cut.start()])).strip())
+    return items
+
+
+@lru_cache(maxsize=1024)
+def parse_response(text):
+    '''
+    JSON objects, numbered lists and bid decisions of an LLM response, parsed once per content.
+    '''
+    bid_decisions = [-1 if m.group(1) is None else int(m.group(1).replace(',', '')) for m in BID_DECISION_PATTERN.finditer(text)]
+    return ParsedResponse(tuple(_json_spans(text)), tuple(_numbered_list(text)), tuple(bid_decisions))